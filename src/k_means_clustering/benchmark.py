@@ -0,0 +1,273 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from dataloader import Dataloader
+from k_means_clustering import KMeansClustering
+
+
+class KMeansBenchmark:
+    """
+    Offline benchmark of KMeansClustering: every configuration (engine and
+    options) is fitted on synthetic Gaussian blobs of every n, d, k
+    combination and on the S-sets already cached in data/ (nothing is
+    downloaded). One record per fit holds the iterations to converge, the
+    time per iteration, the peak memory and the final inertia (and the
+    engine "auto" resolved to). The data and
+    the fits are seeded, so two versions of the code are compared on exactly
+    the same inputs.
+    """
+
+    configs = {
+        "dense": {"engine": "dense"},
+        "hamerly": {"engine": "hamerly"},
+        "auto": {"engine": "auto"},
+        "tree": {"engine": "tree"},
+        "blocked": {"engine": "dense", "memory_budget": 8 * 2 ** 20},
+        "threaded": {"engine": "dense", "n_threads": 4},
+        "streaming": {"chunk_size": 65536},
+        "mini_batch": {"batch_size": 1024, "tol": 1e-4},
+        # an init of a configuration replaces the init of the benchmark
+        "auto_kmeans_parallel": {"engine": "auto", "init": "k-means||"},
+        "hamerly_kmeans_parallel": {"engine": "hamerly", "init": "k-means||"},
+    }
+
+    # the S-sets (Fränti & Virmajoki) have 15 clusters each
+    s_sets = {"s1.txt": 15, "s2.txt": 15, "s3.txt": 15, "s4.txt": 15}
+
+    def __init__(self,
+                 n_values=(10_000, 100_000),
+                 d_values=(2, 8),
+                 k_values=(8, 32, 256),
+                 config_names=None,
+                 n_iter: int = 100,
+                 n_repeats: int = 1,
+                 random_state: int = 0,
+                 init: str = "k-means++",
+                 track_memory: bool = True)\
+            -> None:
+        """
+        Constructor of the benchmark
+        :param n_values: Numbers of synthetic points
+        :param d_values: Dimensions of the synthetic points
+        :param k_values: Numbers of clusters (also the number of blobs), from
+            KDTreeAssignment.min_k (256) on "auto" uses the tree in low dimensions
+        :param config_names: Names of the configurations to run (keys of
+            configs), all of them by default
+        :param int n_iter: Maximum number of iterations of every fit
+        :param int n_repeats: Fits per data set and configuration, with
+            different seeds
+        :param int random_state: Seed of the data sets and the fits
+        :param str init: Initialization of the fits whose configuration has
+            no init
+        :param bool track_memory: Whether to measure the peak memory, in a
+            second (traced) run so that tracemalloc does not slow the timed one
+        :return: None
+        """
+        self.n_values = n_values
+        self.d_values = d_values
+        self.k_values = k_values
+        self.config_names = list(config_names or self.configs)
+        unknown = [name for name in self.config_names if name not in self.configs]
+        if unknown:
+            raise ValueError(f"Unknown benchmark configurations: {unknown}")
+        self.n_iter = n_iter
+        self.n_repeats = n_repeats
+        self.random_state = random_state
+        self.init = init
+        self.track_memory = track_memory
+        self.results = []
+
+    @staticmethod
+    def blobs(n: int,
+              d: int,
+              k: int,
+              rng: np.random.Generator,
+              spread: float = 10.0)\
+            -> np.ndarray:
+        """
+        Gaussian blobs of unit variance around k uniformly drawn centres
+        :param int n: Number of points
+        :param int d: Dimension of the points
+        :param int k: Number of blobs
+        :param np.random.Generator rng: Random number generator
+        :param float spread: Side of the cube the centres are drawn from
+        :return np.ndarray: Points, shape (n, d)
+        """
+        centres = rng.uniform(-spread, spread, size=(k, d))
+        return centres[rng.integers(0, k, size=n)] + rng.standard_normal((n, d))
+
+    def datasets(self):
+        """
+        Yields the data sets of the benchmark, the synthetic ones first
+        :return: Generator of (name, data, k) tuples
+        """
+        for i, (n, d, k) in enumerate((n, d, k)
+                                      for n in self.n_values
+                                      for d in self.d_values
+                                      for k in self.k_values):
+            rng = np.random.default_rng([self.random_state, i])
+            yield f"blobs_n{n}_d{d}_k{k}", self.blobs(n=n, d=d, k=k, rng=rng), k
+        for file_name, k in self.s_sets.items():
+            # only cached files, the loader would download a missing one
+            if not os.path.isfile(os.path.join("data", file_name)):
+                continue
+            loader = Dataloader(file_url=None, file_name=file_name)
+            yield file_name.split(".")[0], np.asarray(loader.data, dtype=float), k
+
+    def run(self)\
+            -> list:
+        """
+        :return list: One dict per fit
+        """
+        self.results = []
+        for name, data, k in self.datasets():
+            for config_name in self.config_names:
+                for repeat in range(self.n_repeats):
+                    record = self.measure(data=data,
+                                          k=k,
+                                          options=self.configs[config_name],
+                                          seed=self.random_state + repeat)
+                    self.results.append({"dataset": name,
+                                         "n": len(data),
+                                         "d": data.shape[1],
+                                         "k": k,
+                                         "config": config_name,
+                                         "repeat": repeat,
+                                         **record})
+        return self.results
+
+    def measure(self,
+                data: np.ndarray,
+                k: int,
+                options: dict,
+                seed: int)\
+            -> dict:
+        """
+        Fits one configuration
+        :param np.ndarray data: Points to be clustered
+        :param int k: Number of clusters
+        :param dict options: Further arguments of KMeansClustering
+        :param int seed: Seed of the fit
+        :return dict: Engine used, iterations, convergence, times, peak memory
+            and inertia
+        """
+        clustering = KMeansClustering(data=data,
+                                      k=k,
+                                      n_iter=self.n_iter,
+                                      random_state=seed,
+                                      **{"init": self.init, **options})
+        start = time.perf_counter()
+        clustering.run()
+        total_time = time.perf_counter() - start
+        iteration_times = [record["time"] for record in clustering.history]
+        record = {"engine": clustering.assignment_engine,  # "auto" resolved
+                  "n_iter": len(clustering.history),
+                  "converged": clustering.converged,
+                  "total_time": total_time,
+                  "time_per_iter": float(np.mean(iteration_times)),
+                  "inertia": clustering.inertia,
+                  "peak_bytes": None}
+        if self.track_memory:
+            record["peak_bytes"] = self.__peak_bytes(data=data,
+                                                     k=k,
+                                                     options=options,
+                                                     seed=seed)
+        return record
+
+    def __peak_bytes(self,
+                     data: np.ndarray,
+                     k: int,
+                     options: dict,
+                     seed: int)\
+            -> int:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            KMeansClustering(data=data,
+                             k=k,
+                             n_iter=self.n_iter,
+                             random_state=seed,
+                             **{"init": self.init, **options}).run()
+            return tracemalloc.get_traced_memory()[1] - before
+        finally:
+            if started:
+                tracemalloc.stop()
+
+    def environment(self)\
+            -> dict:
+        """
+        :return dict: Versions and machine the results were measured with
+        """
+        return {"python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "cpu_count": os.cpu_count(),
+                "random_state": self.random_state,
+                "n_iter": self.n_iter,
+                "init": self.init}
+
+    def export_json(self,
+                    file_path: str)\
+            -> None:
+        with open(file_path, "w") as f:
+            json.dump({"environment": self.environment(),
+                       "results": self.results}, f, indent=2)
+
+    def export_csv(self,
+                   file_path: str)\
+            -> None:
+        columns = []
+        for record in self.results:
+            columns += [key for key in record if key not in columns]
+        with open(file_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline k-means benchmark")
+    parser.add_argument("--n", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--d", type=int, nargs="+", default=[2, 8])
+    parser.add_argument("--k", type=int, nargs="+", default=[8, 32, 256])
+    parser.add_argument("--configs", nargs="+", default=None,
+                        choices=list(KMeansBenchmark.configs))
+    parser.add_argument("--n-iter", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced runs measuring the peak memory")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="results file, .json or .csv")
+    args = parser.parse_args()
+
+    benchmark = KMeansBenchmark(n_values=args.n,
+                                d_values=args.d,
+                                k_values=args.k,
+                                config_names=args.configs,
+                                n_iter=args.n_iter,
+                                n_repeats=args.repeats,
+                                random_state=args.seed,
+                                track_memory=not args.no_memory)
+    for record in benchmark.run():
+        print(f"{record['dataset']:>24} {record['config']:>23} "
+              f"iter={record['n_iter']:>3} {record['time_per_iter'] * 1e3:8.2f} ms/iter "
+              f"inertia={record['inertia']:.6g}")
+    if args.output.endswith(".csv"):
+        benchmark.export_csv(args.output)
+    else:
+        benchmark.export_json(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import numpy as np
+
+from pairwise_distance_calculator import PairwiseDistanceCalculator
+
+
+class CentroidInitializer:
+    """
+    Chooses the starting centroids of k-means: uniformly at random, with
+    k-means++ seeding or with its oversampling parallel variant, k-means||
+    """
+
+    methods = ("random", "k-means++", "k-means||")
+
+    def __init__(self,
+                 data: np.ndarray,
+                 k: int,
+                 rng: np.random.Generator,
+                 weights: np.ndarray = None,
+                 n_local_trials: int = None,
+                 oversampling_factor: float = 2.0,
+                 n_rounds: int = 5,
+                 memory_budget: int = None)\
+            -> None:
+        """
+        Constructor of the initializer
+        :param np.ndarray data: Points to be clustered (may be memory-mapped)
+        :param int k: Number of centroids
+        :param np.random.Generator rng: Random number generator
+        :param np.ndarray weights: Weight of every point, None for unit weights
+        :param int n_local_trials: Candidates tried per k-means++ step, the one
+            reducing the potential the most is kept (default 2 + log k)
+        :param float oversampling_factor: Expected number of candidates sampled
+            per k-means|| round, relative to k
+        :param int n_rounds: Number of k-means|| sampling rounds
+        :param int memory_budget: Size of the distance blocks in bytes
+        :return: None
+        """
+        self.data = data
+        self.k = k
+        self.rng = rng
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.n_local_trials = n_local_trials or 2 + int(np.log(k))
+        self.oversampling_factor = oversampling_factor
+        self.n_rounds = n_rounds
+        self.memory_budget = memory_budget or \
+            PairwiseDistanceCalculator.default_memory_budget
+
+    def run(self,
+            method: str)\
+            -> np.ndarray:
+        """
+        :param str method: "random", "k-means++" or "k-means||"
+        :return np.ndarray: Starting centroids, shape (k, d)
+        """
+        if method == "random":
+            return self.random()
+        if method == "k-means++":
+            return self.kmeans_plusplus()
+        if method == "k-means||":
+            return self.kmeans_parallel()
+        raise ValueError(f"Unknown initialization method: {method}")
+
+    def random(self)\
+            -> np.ndarray:
+        probs = None if self.weights is None else self.weights / np.sum(self.weights)
+        indexes = self.rng.choice(len(self.data), self.k, replace=False, p=probs)
+        return np.asarray(self.data[indexes, :], dtype=float)
+
+    def kmeans_plusplus(self)\
+            -> np.ndarray:
+        """
+        Greedy k-means++: every next centroid is the best of a few candidates
+        sampled proportionally to the squared distance from the chosen ones.
+        The minimum distances are updated with the new centroid only, they are
+        never recomputed against all of the chosen centroids
+        :return np.ndarray: Starting centroids, shape (k, d)
+        """
+        n_rows = len(self.data)
+        centers = np.empty((self.k, self.data.shape[1]))
+        centers[0] = self.data[self.__sample_weighted(self.__point_weights(), 1)[0]]
+        min_dists = np.empty(n_rows)
+        self.__update_min_dists(min_dists=min_dists,
+                                centers=centers[:1],
+                                first=True)
+
+        for i in range(1, self.k):
+            potential = min_dists * self.__point_weights()
+            candidates = self.__sample_weighted(potential, self.n_local_trials)
+            candidate_points = np.asarray(self.data[np.sort(candidates)], dtype=float)
+            candidate_potentials = np.zeros(len(candidate_points))
+            for start, stop, dists in self.__distance_blocks(candidate_points):
+                reduced = np.minimum(min_dists[start:stop, None], dists)
+                if self.weights is not None:
+                    reduced *= self.weights[start:stop, None]
+                candidate_potentials += np.sum(reduced, axis=0)
+            centers[i] = candidate_points[np.argmin(candidate_potentials)]
+            self.__update_min_dists(min_dists=min_dists, centers=centers[i:i + 1])
+        return centers
+
+    def kmeans_parallel(self)\
+            -> np.ndarray:
+        """
+        k-means|| (Bahmani et al.): a few rounds sample every point
+        independently with probability proportional to its squared distance,
+        then the candidates, weighted by the number of points closest to them,
+        are reduced to k centroids with k-means++
+        :return np.ndarray: Starting centroids, shape (k, d)
+        """
+        n_rows = len(self.data)
+        first = self.__sample_weighted(self.__point_weights(), 1)[0]
+        candidates = [np.asarray(self.data[first:first + 1], dtype=float)]
+        min_dists = np.empty(n_rows)
+        self.__update_min_dists(min_dists=min_dists,
+                                centers=candidates[0],
+                                first=True)
+
+        oversampling = self.oversampling_factor * self.k
+        for _ in range(self.n_rounds):
+            potential = min_dists * self.__point_weights()
+            total = np.sum(potential)
+            if total <= 0:
+                break
+            probs = np.minimum(1.0, oversampling * potential / total)
+            chosen = np.flatnonzero(self.rng.random(n_rows) < probs)
+            if len(chosen) == 0:
+                continue
+            new_candidates = np.asarray(self.data[chosen], dtype=float)
+            candidates.append(new_candidates)
+            self.__update_min_dists(min_dists=min_dists, centers=new_candidates)
+
+        candidates = np.concatenate(candidates)
+        if len(candidates) < self.k:
+            extra = self.rng.choice(n_rows, self.k - len(candidates), replace=False)
+            candidates = np.concatenate([candidates,
+                                         np.asarray(self.data[np.sort(extra)], dtype=float)])
+        nearest, _ = PairwiseDistanceCalculator(
+            vectors_1=self.data,
+            vectors_2=candidates,
+            memory_budget=self.memory_budget
+        ).compute_nearest()
+        candidate_weights = np.bincount(nearest,
+                                        weights=self.weights,
+                                        minlength=len(candidates))
+        reducer = CentroidInitializer(data=candidates,
+                                      k=self.k,
+                                      rng=self.rng,
+                                      weights=candidate_weights,
+                                      n_local_trials=self.n_local_trials,
+                                      memory_budget=self.memory_budget)
+        return reducer.kmeans_plusplus()
+
+    def __point_weights(self):
+        return np.ones(len(self.data)) if self.weights is None else self.weights
+
+    def __sample_weighted(self,
+                          potential: np.ndarray,
+                          size: int)\
+            -> np.ndarray:
+        cumulative = np.cumsum(potential)
+        if cumulative[-1] <= 0:  # every point coincides with a centroid
+            return self.rng.integers(0, len(potential), size=size)
+        draws = self.rng.random(size) * cumulative[-1]
+        return np.minimum(np.searchsorted(cumulative, draws, side="right"),
+                          len(potential) - 1)
+
+    def __distance_blocks(self,
+                          centers: np.ndarray):
+        block_rows = max(1, self.memory_budget // (8 * max(len(centers), 1)))
+        n_rows = len(self.data)
+        for start in range(0, n_rows, block_rows):
+            stop = min(start + block_rows, n_rows)
+            dists = PairwiseDistanceCalculator(
+                vectors_1=self.data[start:stop],
+                vectors_2=centers
+            ).compute_distance_no_loop()
+            np.maximum(dists, 0, out=dists)
+            yield start, stop, dists
+
+    def __update_min_dists(self,
+                           min_dists: np.ndarray,
+                           centers: np.ndarray,
+                           first: bool = False)\
+            -> None:
+        for start, stop, dists in self.__distance_blocks(centers):
+            block_min = np.min(dists, axis=1)
+            if first:
+                min_dists[start:stop] = block_min
+            else:
+                np.minimum(min_dists[start:stop], block_min, out=min_dists[start:stop])
@@ -1,24 +1,123 @@
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 from k_means_clustering import KMeansClustering
 
 class ClusterPlotting:
-    def __init__(self, clustering):
+    def __init__(self,
+                 clustering,
+                 mode="scatter",
+                 bins=512,
+                 max_points_per_cluster=None,
+                 chunk_size=1_000_000,
+                 random_state=None):
+        """
+        Plots the first two coordinates of a fitted clustering
+        :param KMeansClustering clustering: Fitted clustering
+        :param str mode: "scatter" draws the points, "density" draws one image
+            of the binned point counts coloured by cluster, its cost does not
+            grow with the number of points drawn
+        :param int bins: Number of bins per axis of the density image
+        :param int max_points_per_cluster: Scatter mode draws at most this many
+            randomly chosen points of every cluster (stratified downsampling)
+        :param int chunk_size: Rows binned at once in density mode
+        :param int random_state: Seed of the downsampling
+        """
+        if mode not in ("scatter", "density"):
+            raise ValueError(f"Unknown plotting mode: {mode}")
         self.clustering = clustering
+        self.mode = mode
+        self.bins = bins
+        self.max_points_per_cluster = max_points_per_cluster
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(random_state)
 
 
     def run(self):
-        colors = ['lightblue', 'pink', 'lightgreen']
-        centr_colors = ['blue', 'red', 'darkgreen']
-
-        for cl_idx in range(0, self.clustering.k):
-            clust = self.clustering.clusters[cl_idx]
-            centr = self.clustering.centroids[cl_idx]
-            color = colors[cl_idx]
-            centr_color = centr_colors[cl_idx]
-
-            x = clust[:, 0]
-            y = clust[:, 1]
-            plt.scatter(x, y, c=color)
-            plt.scatter(centr[0], centr[1], c=centr_color, s=50)
\ No newline at end of file
+        colors, centr_colors = self.colors(k=self.clustering.k)
+        labels = self.clustering.labels
+        if labels is None:
+            labels = self.clustering.predict(points=self.clustering.data)
+
+        if self.mode == "density":
+            self.__plot_density(labels=labels, colors=centr_colors)
+        else:
+            indexes = self.sample(labels=labels)
+            points = np.asarray(self.clustering.data[indexes])
+            # one scatter call for all clusters, colours looked up by label
+            plt.scatter(points[:, 0], points[:, 1],
+                        c=colors[labels[indexes]], s=4, rasterized=True)
+
+        centroids = self.clustering.centroid_matrix
+        plt.scatter(centroids[:, 0], centroids[:, 1],
+                    c=centr_colors, s=50, edgecolors="black")
+
+    @staticmethod
+    def colors(k):
+        """
+        Light colours for the points and dark colours for the centroids of k
+        clusters, taken from a qualitative colour map (any k)
+        :param int k: Number of clusters
+        :return tuple: Point and centroid colours, arrays of shape (k, 4)
+        """
+        cmap = plt.get_cmap("tab10" if k <= 10 else "tab20" if k <= 20 else "hsv")
+        centr_colors = cmap(np.arange(k) if k <= 20 else np.linspace(0, 1, k, endpoint=False))
+        colors = centr_colors.copy()
+        colors[:, :3] = 0.5 + 0.5 * colors[:, :3]  # lighter shade of the same hue
+        return colors, centr_colors
+
+    def sample(self, labels):
+        """
+        Indexes of the points to draw, at most max_points_per_cluster of every
+        cluster
+        :param np.ndarray labels: Cluster index of every point
+        :return np.ndarray: Sorted point indexes
+        """
+        if self.max_points_per_cluster is None:
+            return np.arange(len(labels))
+        order = np.argsort(labels, kind="stable")
+        bounds = np.cumsum(np.bincount(labels, minlength=self.clustering.k))[:-1]
+        chosen = [
+            members if len(members) <= self.max_points_per_cluster
+            else self.rng.choice(members, self.max_points_per_cluster, replace=False)
+            for members in np.split(order, bounds)
+        ]
+        return np.sort(np.concatenate(chosen))
+
+    def __plot_density(self, labels, colors):
+        data = self.clustering.data
+        n_rows = len(data)
+        lower = np.full(2, np.inf)
+        upper = np.full(2, -np.inf)
+        for start in range(0, n_rows, self.chunk_size):
+            chunk = np.asarray(data[start:start + self.chunk_size, :2], dtype=float)
+            lower = np.minimum(lower, chunk.min(axis=0))
+            upper = np.maximum(upper, chunk.max(axis=0))
+        scale = self.bins / np.where(upper > lower, upper - lower, 1)
+
+        # per bin: number of points and sum of their cluster colours
+        n_bins = self.bins * self.bins
+        counts = np.zeros(n_bins)
+        color_sums = np.zeros((n_bins, 3))
+        for start in range(0, n_rows, self.chunk_size):
+            chunk = np.asarray(data[start:start + self.chunk_size, :2], dtype=float)
+            cells = np.minimum(((chunk - lower) * scale).astype(np.int64), self.bins - 1)
+            flat = cells[:, 1] * self.bins + cells[:, 0]  # row = y, column = x
+            chunk_labels = labels[start:start + self.chunk_size]
+            counts += np.bincount(flat, minlength=n_bins)
+            for channel in range(3):
+                color_sums[:, channel] += np.bincount(
+                    flat, weights=colors[chunk_labels, channel], minlength=n_bins
+                )
+
+        image = np.ones((n_bins, 4))
+        filled = counts > 0
+        image[filled, :3] = color_sums[filled] / counts[filled, None]
+        # opacity by log density, empty bins stay transparent
+        image[:, 3] = np.log1p(counts) / np.log1p(max(counts.max(), 1))
+        plt.imshow(image.reshape(self.bins, self.bins, 4),
+                   origin="lower",
+                   extent=(lower[0], upper[0], lower[1], upper[1]),
+                   aspect="auto",
+                   interpolation="nearest")
@@ -0,0 +1,125 @@
+import numpy as np
+
+from k_means_clustering import KMeansClustering
+
+
+class CoresetBuilder:
+    """
+    Lightweight coreset (Bachem et al.) of a large, possibly memory-mapped
+    data set: a weighted sample whose weighted k-means cost approximates the
+    cost of the full data for every set of centroids. Points are sampled by
+    their sensitivity q(x) = 1/2n + ||x - mean||^2 / 2 sum ||y - mean||^2 and
+    weighted by 1 / (size * q(x)). Two chunked passes are made over the data,
+    the first one only computes the mean and the total squared deviation.
+    """
+
+    def __init__(self,
+                 data: np.ndarray,
+                 size: int,
+                 chunk_size: int = 1_000_000,
+                 random_state: int = None)\
+            -> None:
+        """
+        Constructor of the builder
+        :param np.ndarray data: Points to be summarized, shape (n, d)
+        :param int size: Number of draws (distinct points of the coreset may be
+            fewer, repeated draws are merged into one point)
+        :param int chunk_size: Rows read at once
+        :param int random_state: Seed of the random number generator
+        :return: None
+        """
+        self.data = data
+        self.size = size
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(random_state)
+        self.points = None
+        self.weights = None
+        self.indexes = None
+
+    def __chunks(self):
+        for start in range(0, len(self.data), self.chunk_size):
+            stop = min(start + self.chunk_size, len(self.data))
+            yield start, stop, np.asarray(self.data[start:stop], dtype=float)
+
+    def run(self)\
+            -> tuple:
+        """
+        Samples the coreset
+        :return tuple: Coreset points, shape (m, d), and their weights
+        """
+        n_rows = len(self.data)
+        if n_rows == 0:
+            raise ValueError("Cannot build a coreset of an empty data set.")
+
+        # first pass: mean and total squared deviation from the mean
+        total = np.zeros(self.data.shape[1])
+        sq_total = 0.0
+        for _, _, chunk in self.__chunks():
+            total += np.sum(chunk, axis=0)
+            sq_total += float(np.sum(chunk ** 2))
+        mean = total / n_rows
+        cost = max(sq_total - n_rows * float(mean @ mean), 0.0)
+
+        # second pass: the draws falling into every chunk follow a binomial
+        # distribution of the chunk's share of the remaining sensitivity
+        remaining_draws = self.size
+        remaining_mass = 1.0
+        indexes, probs = [], []
+        for start, stop, chunk in self.__chunks():
+            q = 0.5 / n_rows
+            if cost > 0:
+                q = q + 0.5 * np.sum((chunk - mean) ** 2, axis=1) / cost
+            q = np.broadcast_to(q, (stop - start,))
+            mass = float(np.sum(q))
+            if stop == n_rows or remaining_mass <= mass:
+                n_draws = remaining_draws
+            else:
+                n_draws = int(self.rng.binomial(remaining_draws,
+                                                min(mass / remaining_mass, 1.0)))
+            remaining_draws -= n_draws
+            remaining_mass -= mass
+            if n_draws == 0:
+                continue
+            chosen = self.rng.choice(stop - start, n_draws, p=q / mass)
+            indexes.append(start + chosen)
+            probs.append(q[chosen])
+
+        indexes = np.concatenate(indexes)
+        probs = np.concatenate(probs)
+        self.indexes, first, repeats = np.unique(indexes,
+                                                 return_index=True,
+                                                 return_counts=True)
+        self.weights = repeats / (self.size * probs[first])
+        self.points = np.asarray(self.data[self.indexes], dtype=float)
+        return self.points, self.weights
+
+    def fit(self,
+            k: int,
+            n_iter: int,
+            assign_full: bool = False,
+            **options)\
+            -> tuple:
+        """
+        Fits weighted k-means on the coreset
+        :param int k: Number of clusters
+        :param int n_iter: Maximum number of iterations
+        :param bool assign_full: Whether to assign every point of the full data
+            to the fitted centroids (one more chunked pass)
+        :param options: Further arguments of KMeansClustering
+        :return tuple: The clustering fitted on the coreset and the labels of
+            the full data (None unless assign_full)
+        """
+        if self.points is None:
+            self.run()
+        clustering = KMeansClustering(data=self.points,
+                                      k=k,
+                                      n_iter=n_iter,
+                                      weights=self.weights,
+                                      **options)
+        clustering.run()
+        if not assign_full:
+            return clustering, None
+        labels = np.empty(len(self.data), dtype=np.int64)
+        for start, stop, chunk in self.__chunks():
+            labels[start:stop] = clustering.predict(points=chunk)
+        return clustering, labels
@@ -1,18 +1,158 @@
+import hashlib
+import io
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-import requests
 
 class Dataloader:
-      def __init__(self, file_url, file_name):
+      # size of the text pieces parsed by one process (bytes)
+      chunk_bytes = 8 * 2 ** 20
+
+      def __init__(self, file_url, file_name, use_cache=True, n_jobs=None):
+        """
+        Downloads (if needed) and loads a whitespace separated point file.
+        The parsed points are cached in a binary .npy sidecar next to the file,
+        later loads memory-map the sidecar instead of parsing the text again.
+        :param str file_url: Url of the file, used only if it is not in data/
+        :param str file_name: Name of the file in data/
+        :param bool use_cache: Whether to read and write the binary sidecar
+        :param int n_jobs: Number of processes parsing a text larger than
+            chunk_bytes, defaults to the number of CPUs
+        """
         self.data_folder = "data"
         self.file_path = os.path.join(self.data_folder, file_name)
+        self.cache_path = self.file_path + ".npy"
+        self.meta_path = self.file_path + ".meta.json"
+        self.use_cache = use_cache
+        self.n_jobs = n_jobs or os.cpu_count() or 1
         self.download(file_url = file_url, file_name = file_name)
 
-        self.data = np.loadtxt(self.file_path)
+        self.__data = None  # loaded lazily on first access
+
+      @property
+      def data(self):
+        if self.__data is None:
+          self.__data = self.load()
+        return self.__data
 
       def download(self, file_url, file_name):
         os.makedirs(self.data_folder, exist_ok=True) # könyvtár létrehozása, ha már van ilyen = ne csinálja újra
         if not os.path.isfile(self.file_path): # tagadásos feltételkezelés
+          import requests  # only needed online, a cached file loads without it
           r = requests.get(file_url, allow_redirects=True) # megnyitja a weboldalt és letülti a filet, átirányítást=engedélyez
-          open(self.file_path, "wb").write(r.content) # wb: írási üzemmód
\ No newline at end of file
+          open(self.file_path, "wb").write(r.content) # wb: írási üzemmód
+
+      def load(self):
+        """
+        Memory-maps the binary sidecar if it belongs to the current text file,
+        otherwise parses the text and (re)writes the sidecar
+        :return np.ndarray: Points of the file
+        """
+        if self.use_cache and self.is_cache_valid():
+          return np.load(self.cache_path, mmap_mode="r")
+        data = self.parse_text()
+        if self.use_cache:
+          self.write_cache(data=data)
+        return data
+
+      def parse_text(self):
+        """
+        Parses the text file in newline-aligned chunks on a process pool, each
+        worker reads and parses its own byte range (np.loadtxt holds the GIL
+        while it takes the lines, so threads would not parse in parallel).
+        As with np.loadtxt, a single column or row gives a 1-dimensional array
+        :return np.ndarray: Points of the file
+        """
+        bounds = self.chunk_bounds()
+        if len(bounds) <= 2 or self.n_jobs == 1:
+          return np.loadtxt(self.file_path)
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+          parts = list(executor.map(_parse_range,
+                                    [self.file_path] * (len(bounds) - 1),
+                                    bounds,
+                                    bounds[1:]))
+        parts = [part for part in parts if part is not None]
+        if not parts:
+          return np.loadtxt(self.file_path)
+        return np.concatenate(parts).squeeze()
+
+      def chunk_bounds(self):
+        """
+        Byte offsets splitting the file into pieces of about chunk_bytes,
+        each ending after a newline (or at the end of the file)
+        :return list: Offsets from 0 to the file size
+        """
+        size = os.path.getsize(self.file_path)
+        bounds = [0]
+        with open(self.file_path, "rb") as f:
+          while bounds[-1] < size:
+            f.seek(bounds[-1] + self.chunk_bytes)
+            f.readline()  # to the end of the line
+            bounds.append(min(f.tell(), size))
+        return bounds
+
+      def is_cache_valid(self):
+        """
+        The sidecar is valid if the size and the modification time of the text
+        file are unchanged, or if only the time changed but the checksum matches
+        :return bool: Whether the sidecar can be used
+        """
+        if not (os.path.isfile(self.cache_path) and os.path.isfile(self.meta_path)):
+          return False
+        with open(self.meta_path) as f:
+          meta = json.load(f)
+        stat = os.stat(self.file_path)
+        if meta.get("size") != stat.st_size:
+          return False
+        if meta.get("mtime_ns") == stat.st_mtime_ns:
+          return True
+        if meta.get("sha256") != self.checksum():
+          return False
+        self.__write_meta(checksum=meta["sha256"])  # e.g. downloaded again
+        return True
+
+      def write_cache(self, data):
+        """
+        Writes the sidecar and its metadata atomically (temporary file + rename)
+        :param np.ndarray data: Parsed points
+        """
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+          np.save(f, data)
+        os.replace(tmp_path, self.cache_path)
+        self.__write_meta(checksum=self.checksum())
+
+      def checksum(self):
+        sha = hashlib.sha256()
+        with open(self.file_path, "rb") as f:
+          for block in iter(lambda: f.read(2 ** 20), b""):
+            sha.update(block)
+        return sha.hexdigest()
+
+      def __write_meta(self, checksum):
+        stat = os.stat(self.file_path)
+        meta = {"size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": checksum}
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+          json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+
+def _parse_range(file_path, start, stop):
+    """
+    Parses the lines between two byte offsets of a text file in a worker process
+    :param str file_path: Path of the text file
+    :param int start: Offset of the first line
+    :param int stop: Offset after the last line
+    :return np.ndarray: The points as a 2-dimensional array, None if the range is blank
+    """
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        piece = f.read(stop - start)
+    if not piece.strip():
+        return None
+    return np.loadtxt(io.BytesIO(piece), ndmin=2)
@@ -0,0 +1,111 @@
+import numpy as np
+
+from pairwise_distance_calculator import PairwiseDistanceCalculator
+
+
+class HamerlyAssignment:
+    """
+    Nearest centroid assignment accelerated with the triangle inequality
+    (Hamerly's algorithm). For every point an upper bound of the distance to
+    its own centroid and a lower bound of the distance to every other centroid
+    are kept between iterations, so the distances are only recomputed for the
+    points whose assignment can actually change.
+    """
+
+    # relative safety margin for the rounding error of the squared distances
+    eps = 1e-10
+
+    def __init__(self,
+                 data: np.ndarray,
+                 data_norms: np.ndarray = None)\
+            -> None:
+        """
+        Constructor of the assignment engine
+        :param np.ndarray data: Points to be assigned, shape (n, d)
+        :param np.ndarray data_norms: Precomputed squared norms of the points
+        :return: None
+        """
+        self.data = data
+        self.data_norms = np.sum(data ** 2, axis=1) if data_norms is None \
+            else data_norms
+        self.labels = None
+        self.upper = None
+        self.lower = None
+        self.centroids = None
+        self.n_distances = 0  # number of point-centroid distances computed
+
+    def assign(self,
+               centroids: np.ndarray)\
+            -> np.ndarray:
+        """
+        Assigns every point to its nearest centroid
+        :param np.ndarray centroids: Centroids, shape (k, d)
+        :return np.ndarray: Index of the nearest centroid for every point
+        """
+        centroids = np.asarray(centroids, dtype=float)
+        if self.labels is None or len(centroids) < 2:
+            self.__assign_all(centroids=centroids)
+        else:
+            self.__assign_bounded(centroids=centroids)
+        self.centroids = centroids.copy()
+        return self.labels.copy()
+
+    def __assign_all(self,
+                     centroids: np.ndarray)\
+            -> None:
+        n_rows = len(self.data)
+        self.labels = np.zeros(n_rows, dtype=np.int64)
+        self.upper = np.zeros(n_rows)
+        self.lower = np.full(n_rows, np.inf)
+        self.__recompute(indexes=np.arange(n_rows), centroids=centroids)
+
+    def __assign_bounded(self,
+                         centroids: np.ndarray)\
+            -> None:
+        # the bounds follow the centroids by the distance they moved
+        shifts = np.sqrt(np.sum((centroids - self.centroids) ** 2, axis=1))
+        order = np.argsort(shifts)
+        max_shift, second_shift = shifts[order[-1]], shifts[order[-2]]
+        self.upper += shifts[self.labels]
+        self.lower -= np.where(self.labels == order[-1], second_shift, max_shift)
+
+        # half the distance to the closest other centroid
+        centroid_dists = np.sqrt(np.maximum(
+            PairwiseDistanceCalculator(vectors_1=centroids,
+                                       vectors_2=centroids).compute_distance_no_loop(),
+            0
+        ))
+        np.fill_diagonal(centroid_dists, np.inf)
+        half_gaps = 0.5 * np.min(centroid_dists, axis=1)
+
+        bound = np.maximum(np.maximum(half_gaps[self.labels], self.lower), 0)
+        margin = self.eps * (self.data_norms + np.max(np.sum(centroids ** 2, axis=1)))
+        candidates = np.flatnonzero(self.upper ** 2 + margin > bound ** 2)
+
+        # tighten the upper bound before falling back to all k distances
+        diffs = self.data[candidates] - centroids[self.labels[candidates]]
+        self.upper[candidates] = np.sqrt(np.sum(diffs ** 2, axis=1))
+        self.n_distances += len(candidates)
+        still_open = self.upper[candidates] ** 2 + margin[candidates] \
+            > bound[candidates] ** 2
+        self.__recompute(indexes=candidates[still_open], centroids=centroids)
+
+    def __recompute(self,
+                    indexes: np.ndarray,
+                    centroids: np.ndarray)\
+            -> None:
+        if len(indexes) == 0:
+            return
+        dists = PairwiseDistanceCalculator(
+            vectors_1=self.data[indexes],
+            vectors_2=centroids,
+            norms_1=self.data_norms[indexes]
+        ).compute_distance_no_loop()
+        self.n_distances += dists.size
+        labels = np.argmin(dists, axis=1)
+        nearest = dists[np.arange(len(indexes)), labels]
+        self.labels[indexes] = labels
+        self.upper[indexes] = np.sqrt(np.maximum(nearest, 0))
+        if dists.shape[1] > 1:
+            second = np.partition(dists, 1, axis=1)[:, 1]
+            self.lower[indexes] = np.sqrt(np.maximum(second, 0))
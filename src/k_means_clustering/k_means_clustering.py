@@ -1,103 +1,886 @@
+import json
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+
 import numpy as np
 
+from centroid_initializer import CentroidInitializer
+from hamerly_assignment import HamerlyAssignment
+from kd_tree_assignment import KDTreeAssignment
 from pairwise_distance_calculator import PairwiseDistanceCalculator
 
+_NO_PROFILING = nullcontext()
+
 class KMeansClustering:
     def __init__(self,
                  data: np.ndarray, #valtozo: tipus annotacio
                  k: int,
-                 n_iter: int) -> None: #fugveny() -> visszateresi ertek:
+                 n_iter: int,
+                 batch_size: int = None,
+                 learning_rate=None,
+                 random_state: int = None,
+                 engine: str = "auto",
+                 memory_budget: int = None,
+                 dtype=None,
+                 chunk_size: int = None,
+                 tol: float = 0.0,
+                 inertia_tol: float = 0.0,
+                 n_init: int = 1,
+                 n_jobs: int = None,
+                 init="random",
+                 data_norms: np.ndarray = None,
+                 n_threads: int = 1,
+                 profiler=None,
+                 callbacks: list = None,
+                 weights: np.ndarray = None,
+                 checkpoint_path: str = None,
+                 checkpoint_every: int = 1) -> None: #fugveny() -> visszateresi ertek:
         """
         Contstructor for the class executing k-means clustering algorithm
-        :param np.ndarray data: Points to be clustered
+        :param np.ndarray data: Points to be clustered, None for a model fed
+            only through partial_fit
         :param int k: Number of clusters
-        :param int n_iter: Number of iterations
+        :param int n_iter: Maximum number of iterations, the run stops
+            earlier once no label changes (or a tolerance below is reached)
+        :param int batch_size: Size of the sampled batches in mini-batch mode,
+            None runs the full-batch algorithm
+        :param learning_rate: Learning-rate schedule of the mini-batch mode:
+            None for the per-centroid 1 / count rate, a float for a constant
+            rate or a callable mapping the iteration number to the rate
+        :param int random_state: Seed of the random number generator
+        :param str engine: Assignment engine, "dense" computes the full
+            distance matrix, "hamerly" skips the distances that cannot change
+            an assignment (same labels), "tree" queries a KD-tree built over
+            the centroids, "auto" picks "tree" for large k in low dimensions
+            and "dense" otherwise
+        :param int memory_budget: If given, the dense engine computes the
+            distances and the argmin block by block within this many bytes
+            instead of building the full distance matrix
+        :param dtype: Floating point type of the distance computation
+        :param int chunk_size: If given, the data is streamed in chunks of this
+            many rows: every Lloyd iteration is a single pass accumulating the
+            per-cluster sums and counts, so data can be a memory-mapped array
+            (e.g. np.load(path, mmap_mode="r")) larger than the RAM
+        :param float tol: Stop when no centroid moves more than this distance
+        :param float inertia_tol: Stop when the relative decrease of the
+            inertia is below this value
+        :param int n_init: Number of independent restarts, the result with the
+            lowest inertia is kept
+        :param int n_jobs: Number of worker processes of the restarts (the data
+            is shared with them through shared memory), defaults to n_init
+        :param init: Initialization method: "random", "k-means++" or
+            "k-means||" (oversampling variant for large n and k), or the
+            starting centroids as an array of shape (k, d)
+        :param np.ndarray data_norms: Precomputed squared norms of the points,
+            e.g. shared by several fits on the same data
+        :param int n_threads: Number of threads of the dense assignment step,
+            each computes the distances and the argmin of its own row blocks
+        :param KMeansProfiler profiler: Measures the time and the allocated
+            bytes of the phases of every iteration
+        :param list callbacks: Functions called after every iteration with the
+            clustering and the iteration record (history entry, extended with
+            the phase measurements if profiled)
+        :param np.ndarray weights: Weight of every point (e.g. of a coreset),
+            used by the initialization, the centroid updates and the inertia
+        :param str checkpoint_path: File the state is saved to during run()
+            (see save), a killed run continues with load and run(resume=True)
+        :param int checkpoint_every: Number of iterations between checkpoints
         :return: None
         """
 
         self.data = data
         self.k = k
         self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.rng = np.random.default_rng(random_state)
+        if engine not in ("auto", "dense", "hamerly", "tree"):
+            raise ValueError(f"Unknown assignment engine: {engine}")
+        self.engine = engine
+        self.memory_budget = memory_budget
+        self.dtype = dtype
+        if chunk_size is not None and engine == "hamerly":
+            raise ValueError("Streaming mode does not support the hamerly engine.")
+        self.chunk_size = chunk_size
+        self.tol = tol
+        self.inertia_tol = inertia_tol
+        self.n_init = n_init
+        self.n_jobs = n_jobs
+        self.restart_inertias = []
+        if isinstance(init, np.ndarray):
+            if init.shape[0] != k:
+                raise ValueError("The starting centroids must be of shape (k, d).")
+        elif init not in CentroidInitializer.methods:
+            raise ValueError(f"Unknown initialization method: {init}")
+        self.init = init
+        self.__data_norms = data_norms
+        self.n_threads = n_threads
+        self.profiler = profiler
+        self.callbacks = callbacks or []
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.history = []  # one dict per iteration, see run()
+        self.converged = False
+        self.__assigner = None
+        self.__tree = None
+        self.__labels = None
+        self.__sums = None
+        self.__counts = None
+        self.__inertia = None
+        self.__n_changed = None
+        self.__online_counts = None
+        self.__batch_counts = None  # centroid weights of the mini-batch mode
+        self.__n_partial_fits = 0
 
         self.__clusters = None  #__nev => privat valtozo, csak a program latja es modosithatja
-        self.__centroids = None
+        self.__centroids = None  # dim = (k, d)
+        self.__centroid_dict = None
 
         self.__prepare()
 
     def __prepare(self)\
             -> None:
-        n_rows = self.data.shape[0]
-        indexes = np.random.choice(n_rows,
-                                   self.k,
-                                   replace=False)
-        self.__centroids = dict(zip(
-            range(0, self.k),
-            self.data[indexes, :]
-        ))  # konvertalas dictionary formatumba
-        # self.__centroids = self.data[indexes, :] #minden oszlop kivalasztasa
         self.__clusters = dict()
         for i in range(0, self.k):
             self.__clusters[i] = []
+        if self.data is None:
+            return  # the first partial_fit batch initializes the centroids
+        self.__set_centroids(self.__initial_centroids(data=self.data))
+
+    def __initial_centroids(self,
+                            data: np.ndarray)\
+            -> np.ndarray:
+        if isinstance(self.init, np.ndarray):
+            return self.init.astype(float)  # copy, the run must not modify it
+        initializer = CentroidInitializer(data=data,
+                                          k=self.k,
+                                          rng=self.rng,
+                                          weights=self.weights if data is self.data
+                                          else None,
+                                          memory_budget=self.memory_budget)
+        return initializer.run(method=self.init)
 
     @property
     def clusters(self)\
             -> dict: # privat valtozo ertekenek megmutatasa a felhasznalonak
+        if self.__clusters is None and self.__labels is not None:
+            with self.__phase("group_by_index"):
+                self.__clusters = self.group_by_index(indexes=self.__labels)
+            if self.profiler is not None:
+                self.profiler.flush(label="clusters")
+                self.profiler.stop()
         return self.__clusters
 
+    @property
+    def labels(self)\
+            -> np.ndarray:
+        """
+        Cluster index of every point (None before the first assignment)
+        """
+        return self.__labels
+
     @property
     def centroids(self)\
             -> dict:
+        if self.__centroid_dict is None and self.__centroids is not None:
+            self.__centroid_dict = dict(zip(range(0, self.k), self.__centroids))
+        return self.__centroid_dict
+
+    @property
+    def centroid_matrix(self)\
+            -> np.ndarray:
+        """
+        Centroids stacked into one array, shape (k, d)
+        """
         return self.__centroids
 
+    @property
+    def inertia(self)\
+            -> float:
+        """
+        Sum of squared distances of the points to their assigned centroid
+        at the last assignment
+        """
+        return self.__inertia
+
+    @property
+    def data_norms(self)\
+            -> np.ndarray:
+        """
+        Squared norms of the points, computed once per fit (None in streaming
+        mode unless given)
+        """
+        if self.__data_norms is None and self.data is not None \
+                and self.chunk_size is None:
+            self.__data_norms = np.sum(self.data ** 2, axis=1)
+        return self.__data_norms
+
+    @property
+    def assignment_engine(self)\
+            -> str:
+        """
+        The engine actually used, "auto" resolved by k and the dimension
+        """
+        if self.engine != "auto":
+            return self.engine
+        dim = self.data.shape[1] if self.data is not None \
+            else self.centroid_matrix.shape[1]
+        return "tree" if KDTreeAssignment.is_worth_it(k=self.k, dim=dim) else "dense"
+
+    def __set_centroids(self,
+                        centroids: np.ndarray)\
+            -> None:
+        self.__centroids = np.asarray(centroids, dtype=float)
+        self.__centroid_dict = None
+
     # Run függvény
-    def run(self)\
+    def run(self,
+            resume: bool = False)\
+            -> None:
+        """
+        Runs at most n_iter iterations. Every iteration appends a dict to
+        history with the inertia, the number of changed labels, the largest
+        centroid shift and the elapsed time (seconds) of the iteration
+        :param bool resume: Continue from the current state (e.g. a loaded
+            checkpoint) instead of starting over, the iterations already in
+            history count towards n_iter
+        :return: None
+        """
+        if self.data is None:
+            raise ValueError("run() needs data, use partial_fit for streams.")
+        if resume and self.n_init > 1:
+            raise ValueError("Runs with restarts (n_init > 1) cannot be resumed.")
+        if not resume:
+            self.history = []
+            self.converged = False
+            self.__batch_counts = None
+        if self.n_init > 1:
+            self.__run_restarts()
+        elif not self.converged:
+            if self.batch_size is not None:
+                self.__run_mini_batch()
+            else:
+                self.__run_lloyd()
+        if self.checkpoint_path is not None:
+            self.save(file_path=self.checkpoint_path)
+        if self.profiler is not None:
+            self.profiler.flush(label="final")
+            self.profiler.stop()
+
+    def __run_lloyd(self)\
             -> None:
-        for i in range(self.n_iter):
+        for i in range(len(self.history), self.n_iter):
+            start = time.perf_counter()
+            previous_centroids = self.centroid_matrix
             self.__calculate_clusters()
-            self.__calculate_centroids()
+            with self.__phase("calculate_centroids"):
+                self.__calculate_centroids()
+            shift = np.max(np.sqrt(np.sum(
+                (self.centroid_matrix - previous_centroids) ** 2, axis=1
+            )))
+            self.history.append({"iteration": i,
+                                 "inertia": self.__inertia,
+                                 "n_changed": self.__n_changed,
+                                 "shift": float(shift),
+                                 "time": time.perf_counter() - start})
+            self.__end_iteration()
+            if self.__is_converged():
+                self.converged = True
+                break
+
+    def __phase(self,
+                name: str):
+        return _NO_PROFILING if self.profiler is None else self.profiler.phase(name)
+
+    def __end_iteration(self)\
+            -> None:
+        record = self.history[-1]
+        if self.profiler is not None:
+            record = self.profiler.end_iteration(record)
+        for callback in self.callbacks:
+            callback(self, record)
+        if self.checkpoint_path is not None \
+                and len(self.history) % self.checkpoint_every == 0:
+            self.save(file_path=self.checkpoint_path)
+
+    def save(self,
+             file_path: str,
+             include_labels: bool = True)\
+            -> None:
+        """
+        Saves the state of the model to an uncompressed .npz file atomically
+        (temporary file + rename): the centroids, the labels and the cluster
+        counts, the history (its length is the iteration counter) and the
+        state of the random number generator
+        :param str file_path: Path of the checkpoint
+        :param bool include_labels: Whether to save the labels of the points
+            (without them the first resumed iteration counts every label as
+            changed)
+        :return: None
+        """
+        if self.__centroids is None:
+            raise ValueError("The model has no centroids yet.")
+        meta = {"k": self.k,
+                "n_iter": self.n_iter,
+                "converged": self.converged,
+                "inertia": self.__inertia,
+                "n_partial_fits": self.__n_partial_fits,
+                "history": self.history,
+                "rng_state": self.rng.bit_generator.state}
+        arrays = {"centroids": self.__centroids}
+        if include_labels and self.__labels is not None:
+            arrays["labels"] = self.__labels
+        for name, counts in (("counts", self.__counts),
+                             ("online_counts", self.__online_counts),
+                             ("batch_counts", self.__batch_counts)):
+            if counts is not None:
+                arrays[name] = counts
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls,
+             file_path: str,
+             data: np.ndarray = None,
+             **options)\
+            -> "KMeansClustering":
+        """
+        Restores a model saved by save, without running any initialization
+        :param str file_path: Path of the checkpoint
+        :param np.ndarray data: Points of the fit to resume, None for a model
+            used by predict and partial_fit only
+        :param options: Further constructor arguments (they are not saved)
+        :return KMeansClustering: The restored model
+        """
+        with np.load(file_path) as checkpoint:
+            arrays = {name: checkpoint[name] for name in checkpoint.files}
+        meta = json.loads(str(arrays.pop("meta")))
+        options.setdefault("n_iter", meta["n_iter"])
+        clustering = cls(data=data,
+                         k=meta["k"],
+                         init=arrays["centroids"],
+                         **options)
+        clustering.__set_centroids(arrays["centroids"])  # also without data
+        clustering.rng.bit_generator.state = meta["rng_state"]
+        clustering.history = meta["history"]
+        clustering.converged = meta["converged"]
+        clustering.__inertia = meta["inertia"]
+        clustering.__n_partial_fits = meta["n_partial_fits"]
+        clustering.__labels = arrays.get("labels")
+        clustering.__counts = arrays.get("counts")
+        clustering.__online_counts = arrays.get("online_counts")
+        clustering.__batch_counts = arrays.get("batch_counts")
+        if clustering.__labels is not None and data is not None:
+            clustering.__clusters = None  # grouped lazily by the clusters property
+        return clustering
+
+    def partial_fit(self,
+                    batch: np.ndarray,
+                    weights: np.ndarray = None)\
+            -> None:
+        """
+        Online update with a batch of new points: every centroid moves towards
+        the mean of its new points by the learning-rate schedule (by default
+        its share of all the points it has absorbed so far)
+        :param np.ndarray batch: New points, shape (m, d)
+        :param np.ndarray weights: Weights of the new points, None for unit weights
+        :return: None
+        """
+        batch = np.asarray(batch, dtype=float)
+        if self.__centroids is None:
+            if len(batch) < self.k:
+                raise ValueError("The first batch must contain at least k points.")
+            self.__set_centroids(self.__initial_centroids(data=batch))
+        if self.__online_counts is None:
+            # a fitted model keeps the weight of the points it was fitted on
+            self.__online_counts = np.zeros(self.k) if self.__counts is None \
+                else self.__counts.copy()
+        centroids = self.centroid_matrix.copy()
+        self.__update_mini_batch(centroids=centroids,
+                                 counts=self.__online_counts,
+                                 batch=batch,
+                                 labels=self.predict(points=batch),
+                                 iteration=self.__n_partial_fits,
+                                 weights=weights)
+        self.__set_centroids(centroids)
+        self.__n_partial_fits += 1
+
+    def predict(self,
+                points: np.ndarray)\
+            -> np.ndarray:
+        """
+        Assigns points to the current centroids without refitting
+        :param np.ndarray points: Points, shape (m, d)
+        :return np.ndarray: Nearest centroid index of every point
+        """
+        if self.__centroids is None:
+            raise ValueError("The model has no centroids yet.")
+        labels, _ = self.calculate_nearest_centroids(vectors=points)
+        return labels
+
+    def __run_restarts(self)\
+            -> None:
+        """
+        Runs n_init independently seeded fits in a process pool and keeps the
+        centroids of the one with the lowest inertia. A whole memory-mapped
+        file is reopened by the workers, any other data set (also a slice of
+        a memmap) is copied once into shared memory, so the data is never
+        pickled. The history of the kept fit is passed to the profiler and
+        the callbacks afterwards
+        :return: None
+        """
+        seeds = self.rng.integers(0, 2 ** 32, size=self.n_init)
+        options = self.restart_options()
+        shm = None
+        if _maps_whole_file(self.data):
+            source = ("memmap", self.data.filename, self.data.offset,
+                      self.data.shape, self.data.dtype.str)
+        else:
+            data = np.ascontiguousarray(self.data)
+            shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+            source = ("shm", shm.name, 0, data.shape, data.dtype.str)
+        try:
+            with ProcessPoolExecutor(max_workers=self.n_jobs or self.n_init) as executor:
+                results = list(executor.map(
+                    _fit_restart,
+                    [source] * self.n_init,
+                    [self.k] * self.n_init,
+                    [self.n_iter] * self.n_init,
+                    seeds,
+                    [options] * self.n_init
+                ))
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        self.restart_inertias = [inertia for _, inertia, _, _ in results]
+        centroids, _, history, converged = \
+            results[int(np.argmin(self.restart_inertias))]
+        self.__set_centroids(centroids)
+        self.history = history
+        self.converged = converged
+        for record in history:
+            # the workers have no profiler or callbacks, report the kept fit
+            if self.profiler is not None:
+                record = self.profiler.end_iteration(record)
+            for callback in self.callbacks:
+                callback(self, record)
+        self.__calculate_clusters()  # labels of the kept centroids
+        if self.chunk_size is None:
+            # the streaming pass accumulates them itself, partial_fit and
+            # the checkpoint continue from these counts
+            self.__sums = np.zeros((self.k, self.data.shape[1]))
+            self.__counts = np.zeros(self.k)
+            self.accumulate(points=self.data,
+                            labels=self.__labels,
+                            sums=self.__sums,
+                            counts=self.__counts,
+                            weights=self.weights)
+
+    def restart_options(self)\
+            -> dict:
+        """
+        Constructor arguments shared by all restarts of run()
+        :return dict: Keyword arguments of KMeansClustering
+        """
+        return dict(batch_size=self.batch_size,
+                    learning_rate=self.learning_rate,
+                    engine=self.engine,
+                    memory_budget=self.memory_budget,
+                    dtype=self.dtype,
+                    chunk_size=self.chunk_size,
+                    tol=self.tol,
+                    inertia_tol=self.inertia_tol,
+                    init=self.init,
+                    n_threads=self.n_threads,
+                    weights=self.weights)
+
+    def __is_converged(self)\
+            -> bool:
+        last = self.history[-1]
+        if last["n_changed"] == 0:
+            return True  # the centroids cannot move any more
+        if last["shift"] <= self.tol:
+            return True
+        if len(self.history) > 1 and self.inertia_tol > 0:
+            previous = self.history[-2]["inertia"]
+            return previous - last["inertia"] <= self.inertia_tol * previous
+        return False
+
+    def __run_mini_batch(self)\
+            -> None:
+        """
+        Mini-batch k-means: every iteration moves the centroids towards the
+        means of a sampled batch, the full data is assigned only once at the end
+        :return: None
+        """
+        n_rows = self.data.shape[0]
+        batch_size = min(self.batch_size, n_rows)
+        if self.__batch_counts is None:
+            self.__batch_counts = np.zeros(self.k)
+        counts = self.__batch_counts
+        for i in range(len(self.history), self.n_iter):
+            start = time.perf_counter()
+            indexes = self.rng.choice(n_rows, batch_size, replace=False)
+            batch = self.data[indexes]
+            with self.__phase("calculate_pairwise_distances"):
+                dists = self.calculate_pairwise_distances(
+                    vectors_1=batch,
+                    vectors_2=self.centroid_matrix
+                )
+            with self.__phase("calculate_nearest_centroid_index"):
+                labels = self.calculate_nearest_centroid_index(dists=dists)
+            batch_weights = None if self.weights is None else self.weights[indexes]
+            previous_centroids = self.centroid_matrix
+            centroids = previous_centroids.copy()
+            with self.__phase("update_mini_batch"):
+                self.__update_mini_batch(centroids=centroids,
+                                         counts=counts,
+                                         batch=batch,
+                                         labels=labels,
+                                         iteration=i,
+                                         weights=batch_weights)
+            shift = np.max(np.sqrt(np.sum(
+                (centroids - previous_centroids) ** 2, axis=1
+            )))
+            self.__set_centroids(centroids)
+            self.history.append({"iteration": i,
+                                 "inertia": self.__weighted_sum(
+                                     dists[np.arange(batch_size), labels],
+                                     weights=batch_weights),
+                                 "n_changed": None,  # batch inertia only
+                                 "shift": float(shift),
+                                 "time": time.perf_counter() - start})
+            self.__end_iteration()
+            if self.tol > 0 and shift <= self.tol:
+                self.converged = True
+                break
+        self.__calculate_clusters()
+
+    def __update_mini_batch(self,
+                            centroids: np.ndarray,
+                            counts: np.ndarray,
+                            batch: np.ndarray,
+                            labels: np.ndarray,
+                            iteration: int,
+                            weights: np.ndarray = None)\
+            -> None:
+        """
+        Moves the centroids (in place) towards the means of their batch points
+        :param np.ndarray centroids: Centroids, shape (k, d)
+        :param np.ndarray counts: Number of points seen so far per centroid
+        :param np.ndarray batch: Points of the batch
+        :param np.ndarray labels: Nearest centroid index of the batch points
+        :param int iteration: Index of the current iteration
+        :param np.ndarray weights: Weights of the batch points
+        :return: None
+        """
+        sums = np.zeros_like(centroids)
+        batch_counts = np.zeros(self.k)
+        self.accumulate(points=batch,
+                        labels=labels,
+                        sums=sums,
+                        counts=batch_counts,
+                        weights=weights)
+        seen = batch_counts > 0
+        counts += batch_counts
+        batch_means = sums[seen] / batch_counts[seen, None]
+        if self.learning_rate is None:
+            # a batch mean weighs as much as all of its points: per point 1 / count
+            rates = batch_counts[seen] / counts[seen]
+        elif callable(self.learning_rate):
+            rates = np.full(seen.sum(), self.learning_rate(iteration))
+        else:
+            rates = np.full(seen.sum(), self.learning_rate)
+        centroids[seen] += rates[:, None] * (batch_means - centroids[seen])
 
     # Run függvényei
     def __calculate_clusters(self)\
             -> None: #visszateresi ertek
-        parwise_dists = self.calculate_pairwise_distances()
-        nearest_centroid_indexes = self.calculate_nearest_centroid_index(
-            dists=parwise_dists
-        )
-        clusters = self.group_by_index(indexes=nearest_centroid_indexes)
-        self.__clusters = clusters
+        if self.chunk_size is not None:
+            self.__calculate_clusters_streaming()
+            return
+        engine = self.assignment_engine
+        if engine == "hamerly":
+            if self.__assigner is None:
+                self.__assigner = HamerlyAssignment(data=self.data,
+                                                    data_norms=self.data_norms)
+            with self.__phase("hamerly_assignment"):
+                nearest_centroid_indexes = self.__assigner.assign(
+                    centroids=self.centroid_matrix
+                )
+            # the bounds are not exact distances, the inertia is computed directly
+            nearest_dists = np.sum(
+                (self.data - self.centroid_matrix[nearest_centroid_indexes]) ** 2,
+                axis=1
+            )
+        elif engine == "tree" or self.memory_budget is not None \
+                or self.n_threads > 1:
+            with self.__phase("calculate_nearest_centroids"):
+                nearest_centroid_indexes, nearest_dists = \
+                    self.calculate_nearest_centroids()
+        else:
+            with self.__phase("calculate_pairwise_distances"):
+                parwise_dists = self.calculate_pairwise_distances()
+            with self.__phase("calculate_nearest_centroid_index"):
+                nearest_centroid_indexes = self.calculate_nearest_centroid_index(
+                    dists=parwise_dists
+                )
+            nearest_dists = np.take_along_axis(
+                parwise_dists, nearest_centroid_indexes[:, None], axis=1
+            )[:, 0]
+        self.__inertia = self.__weighted_sum(nearest_dists, weights=self.weights)
+        if self.__labels is None:
+            self.__n_changed = len(nearest_centroid_indexes)
+        else:
+            self.__n_changed = int(np.count_nonzero(
+                nearest_centroid_indexes != self.__labels
+            ))
+        self.__labels = nearest_centroid_indexes
+        self.__clusters = None  # materialised lazily by the clusters property
+
+    def __calculate_clusters_streaming(self)\
+            -> None:
+        """
+        Assigns the data chunk by chunk and accumulates the per-cluster sums and
+        counts of the next centroid update in the same pass, only the labels
+        are kept for every point
+        :return: None
+        """
+        n_rows = self.data.shape[0]
+        first_pass = self.__labels is None
+        if first_pass:
+            self.__labels = np.empty(n_rows, dtype=np.int32)
+        sums = np.zeros((self.k, self.data.shape[1]))
+        counts = np.zeros(self.k)
+        inertia = 0.0
+        n_changed = n_rows if first_pass else 0
+        for start in range(0, n_rows, self.chunk_size):
+            stop = min(start + self.chunk_size, n_rows)
+            chunk = np.asarray(self.data[start:stop], dtype=float)
+            with self.__phase("calculate_nearest_centroids"):
+                labels, dists = self.calculate_nearest_centroids(
+                    vectors=chunk,
+                    norms=None if self.__data_norms is None
+                    else self.__data_norms[start:stop]
+                )
+            chunk_weights = None if self.weights is None \
+                else self.weights[start:stop]
+            inertia += self.__weighted_sum(dists, weights=chunk_weights)
+            if not first_pass:
+                n_changed += int(np.count_nonzero(
+                    labels != self.__labels[start:stop]
+                ))
+            self.__labels[start:stop] = labels
+            with self.__phase("calculate_centroids"):
+                self.accumulate(points=chunk,
+                                labels=labels,
+                                sums=sums,
+                                counts=counts,
+                                weights=chunk_weights)
+        self.__sums = sums
+        self.__counts = counts
+        self.__inertia = inertia
+        self.__n_changed = n_changed
+        self.__clusters = None  # materialised lazily by the clusters property
 
     def __calculate_centroids(self)\
             -> None:
-        centroids = dict()
-        for i in range(0, self.k):
-            centroid = np.mean(self.clusters[i], axis=0)
-            centroids[i] = centroid
-        self.__centroids = centroids
+        if self.chunk_size is None:
+            # one bincount pass instead of a mask and a mean per cluster
+            self.__sums = np.zeros((self.k, self.data.shape[1]))
+            self.__counts = np.zeros(self.k)
+            self.accumulate(points=self.data,
+                            labels=self.__labels,
+                            sums=self.__sums,
+                            counts=self.__counts,
+                            weights=self.weights)
+        centroids = self.__sums / np.maximum(self.__counts, 1)[:, None]
+        empty = self.__counts == 0
+        if np.any(empty):
+            centroids[empty] = self.__relocate_empty(n_empty=int(np.sum(empty)))
+        self.__set_centroids(centroids)
+
+    def __relocate_empty(self,
+                         n_empty: int)\
+            -> np.ndarray:
+        """
+        New centroids for the empty clusters instead of NaN means: the points
+        farthest from their centroid (in streaming mode the old centroids are
+        kept, as that would need another pass over the data)
+        :param int n_empty: Number of empty clusters
+        :return np.ndarray: Centroids of the empty clusters
+        """
+        empty = self.__counts == 0
+        if self.chunk_size is not None:
+            return self.centroid_matrix[empty]
+        dists = np.sum(
+            (self.data - self.centroid_matrix[self.__labels]) ** 2, axis=1
+        )
+        farthest = np.argpartition(dists, -n_empty)[-n_empty:]
+        return np.asarray(self.data[farthest], dtype=float)
 
     # segédfüggvények
-    def calculate_pairwise_distances(self)\
+    def calculate_pairwise_distances(self,
+                                     vectors_1: np.ndarray = None,
+                                     vectors_2: np.ndarray = None)\
             -> np.ndarray:
-        vectors_1 = self.data
+        norms_1 = None
+        if vectors_1 is None:
+            vectors_1 = self.data
+            norms_1 = self.data_norms
         #vectors_2 = self.centroids.values()
-        vectors_2 = np.array(
-            [self.centroids[i] for i in range(0, self.k)]
-        ) #list comprehension
+        if vectors_2 is None:
+            vectors_2 = self.centroid_matrix
         calculator = PairwiseDistanceCalculator(
             vectors_1=vectors_1,
-            vectors_2=vectors_2
+            vectors_2=vectors_2,
+            dtype=self.dtype,
+            norms_1=norms_1
         )
         return calculator.compute_distance_no_loop()
 
+    def calculate_nearest_centroids(self,
+                                    vectors: np.ndarray = None,
+                                    norms: np.ndarray = None)\
+            -> tuple:
+        """
+        Fused distance and argmin computation over blocks of the points (or a
+        KD-tree query with the tree engine)
+        :param np.ndarray vectors: Points to assign, defaults to the data
+        :param np.ndarray norms: Squared norms of the points, if known
+        :return tuple: Nearest centroid indexes and squared distances
+        """
+        if vectors is None:
+            vectors = self.data
+            norms = self.data_norms
+        if self.assignment_engine == "tree":
+            if self.__tree is None or self.__tree.centroids is not self.centroid_matrix:
+                self.__tree = KDTreeAssignment(centroids=self.centroid_matrix)
+            return self.__tree.query(points=vectors)
+        calculator = PairwiseDistanceCalculator(
+            vectors_1=vectors,
+            vectors_2=self.centroid_matrix,
+            dtype=self.dtype,
+            memory_budget=self.memory_budget,
+            norms_1=norms
+        )
+        return calculator.compute_nearest(n_threads=self.n_threads)
+
     @staticmethod
     def calculate_nearest_centroid_index(dists: np.ndarray)\
             -> np.ndarray:
         nearest_centroid_indexes = np.argmin(dists, axis=1)
         return nearest_centroid_indexes
 
+    def accumulate(self,
+                   points: np.ndarray,
+                   labels: np.ndarray,
+                   sums: np.ndarray,
+                   counts: np.ndarray,
+                   weights: np.ndarray = None)\
+            -> None:
+        """
+        Adds the points to the per-cluster sums and counts (in place)
+        :param np.ndarray points: Points, shape (n, d)
+        :param np.ndarray labels: Cluster index of the points
+        :param np.ndarray sums: Per-cluster coordinate sums, shape (k, d)
+        :param np.ndarray counts: Per-cluster point counts (total weights),
+            shape (k, )
+        :param np.ndarray weights: Weights of the points, None for unit weights
+        :return: None
+        """
+        counts += np.bincount(labels, weights=weights, minlength=self.k)
+        for dim in range(points.shape[1]):
+            coords = points[:, dim] if weights is None else points[:, dim] * weights
+            sums[:, dim] += np.bincount(labels,
+                                        weights=coords,
+                                        minlength=self.k)
+
+    @staticmethod
+    def __weighted_sum(values: np.ndarray,
+                       weights: np.ndarray = None)\
+            -> float:
+        if weights is None:
+            return float(np.sum(values))
+        return float(np.dot(values, weights))
+
     def group_by_index(self,
                        indexes: np.array)\
             -> dict:
-        clusters = dict()
-        for cl in range(0, self.k):
-            clusters[cl] = self.data[indexes == cl]
-        return clusters
\ No newline at end of file
+        """
+        Points of every cluster, built in one pass: the data is reordered by
+        cluster once and every cluster is a view of its contiguous block
+        :param np.array indexes: Cluster index of every point
+        :return dict: Cluster index -> points of the cluster
+        """
+        order = np.argsort(indexes, kind="stable")
+        bounds = np.cumsum(np.bincount(indexes, minlength=self.k))[:-1]
+        blocks = np.split(self.data[order], bounds)
+        return dict(zip(range(0, self.k), blocks))
+
+
+def _maps_whole_file(data: np.ndarray)\
+        -> bool:
+    """
+    Whether the data is a whole C-contiguous np.memmap, so the workers can
+    reopen its file from filename, offset and shape (a sliced memmap keeps
+    the offset of its parent, not its own start)
+    :param np.ndarray data: The data set
+    :return bool: True if the file can be reopened
+    """
+    if not isinstance(data, np.memmap) or data.filename is None \
+            or not data.flags.c_contiguous:
+        return False
+    mapping = getattr(data, "_mmap", None)
+    if mapping is None or data.base is not mapping:
+        return False
+    start = np.frombuffer(mapping, dtype=np.uint8).ctypes.data
+    return data.ctypes.data == start + data.offset % mmap.ALLOCATIONGRANULARITY
+
+
+def _fit_restart(source: tuple,
+                 k: int,
+                 n_iter: int,
+                 seed: int,
+                 options: dict)\
+        -> tuple:
+    """
+    One restart of KMeansClustering.run in a worker process
+    :param tuple source: Where to find the data: ("shm" or "memmap", name,
+        offset, shape, dtype)
+    :param int k: Number of clusters
+    :param int n_iter: Maximum number of iterations
+    :param int seed: Seed of the restart
+    :param dict options: Further constructor arguments
+    :return tuple: Centroids, inertia, history and convergence flag
+    """
+    kind, name, offset, shape, dtype = source
+    shm = None
+    if kind == "shm":
+        shm = shared_memory.SharedMemory(name=name)  # unlinked by the parent
+        data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    else:
+        data = np.memmap(name, dtype=dtype, mode="r", offset=offset, shape=shape)
+    try:
+        clustering = KMeansClustering(data=data,
+                                      k=k,
+                                      n_iter=n_iter,
+                                      random_state=seed,
+                                      **options)
+        clustering.run()
+        return (clustering.centroid_matrix.copy(), clustering.inertia,
+                clustering.history, clustering.converged)
+    finally:
+        del data
+        if shm is not None:
+            shm.close()
@@ -0,0 +1,197 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from k_means_clustering import KMeansClustering
+from pairwise_distance_calculator import PairwiseDistanceCalculator
+
+
+class KSweep:
+    """
+    Fits k-means for a range of k values to choose k (elbow / silhouette).
+    The sorted k values are cut into contiguous segments fitted in parallel
+    threads, inside a segment only the first k starts cold, every further k is
+    warm-started from the previous solution by splitting its clusters with
+    the largest inertia. The squared norms of the points are computed once
+    and shared by all the fits.
+    """
+
+    def __init__(self,
+                 data: np.ndarray,
+                 k_values,
+                 n_iter: int,
+                 n_jobs: int = None,
+                 silhouette_sample: int = 2000,
+                 random_state: int = None,
+                 init: str = "k-means++",
+                 **options)\
+            -> None:
+        """
+        Constructor of the sweep
+        :param np.ndarray data: Points to be clustered
+        :param k_values: Numbers of clusters to try
+        :param int n_iter: Maximum number of iterations of every fit
+        :param int n_jobs: Number of parallel segments, defaults to the CPUs
+        :param int silhouette_sample: Number of points the silhouette score is
+            estimated on (a sample x sample distance matrix, never n x n)
+        :param int random_state: Seed of the random number generator
+        :param str init: Initialization of the cold fits
+        :param options: Further arguments of KMeansClustering
+        :return: None
+        """
+        self.data = data
+        self.k_values = sorted(set(k_values))
+        self.n_iter = n_iter
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.silhouette_sample = silhouette_sample
+        self.rng = np.random.default_rng(random_state)
+        self.init = init
+        self.options = options
+        self.data_norms = np.sum(data ** 2, axis=1)
+        self.models = dict()  # k -> fitted KMeansClustering
+        self.results = []
+
+    def run(self)\
+            -> list:
+        """
+        :return list: One dict per k with the inertia, the estimated silhouette
+            score and the number of iterations of the fit
+        """
+        n_segments = min(self.n_jobs, len(self.k_values))
+        segments = [list(s) for s in np.array_split(self.k_values, n_segments)]
+        seeds = self.rng.integers(0, 2 ** 32, size=n_segments)
+        with ThreadPoolExecutor(max_workers=n_segments) as executor:
+            fitted = list(executor.map(self.__fit_segment, segments, seeds))
+        for models in fitted:
+            self.models.update(models)
+
+        sample = self.rng.choice(len(self.data),
+                                 min(self.silhouette_sample, len(self.data)),
+                                 replace=False)
+        self.results = [
+            {"k": k,
+             "inertia": self.models[k].inertia,
+             "silhouette": self.silhouette(labels=self.models[k].labels,
+                                           sample=sample),
+             "n_iter": len(self.models[k].history)}
+            for k in self.k_values
+        ]
+        return self.results
+
+    def __fit_segment(self,
+                      k_values: list,
+                      seed: int)\
+            -> dict:
+        rng = np.random.default_rng(seed)
+        models = dict()
+        previous = None
+        for k in k_values:
+            init = self.init if previous is None \
+                else self.split_clusters(model=previous, k=k)
+            model = KMeansClustering(data=self.data,
+                                     k=int(k),
+                                     n_iter=self.n_iter,
+                                     random_state=int(rng.integers(0, 2 ** 32)),
+                                     init=init,
+                                     data_norms=self.data_norms,
+                                     **self.options)
+            model.run()
+            models[int(k)] = model
+            previous = model
+        return models
+
+    def split_clusters(self,
+                       model: KMeansClustering,
+                       k: int)\
+            -> np.ndarray:
+        """
+        Warm start for k clusters from a fit with fewer: the clusters with the
+        largest inertia are split in two along their principal direction.
+        A round splits at most every cluster once, so for k more than twice
+        the clusters of the model the points are reassigned to the split
+        centroids and the next round splits the clusters with the largest
+        inertia again
+        :param KMeansClustering model: Fitted model with less than k clusters
+        :param int k: Number of clusters of the warm start
+        :return np.ndarray: Starting centroids, shape (k, d)
+        """
+        if k <= model.k:
+            raise ValueError("The warm start needs more clusters than the model.")
+        centroids = model.centroid_matrix.copy()
+        labels = model.labels
+        sq_dists = np.sum((self.data - centroids[labels]) ** 2, axis=1)
+        while True:
+            cluster_inertia = np.bincount(labels, weights=sq_dists,
+                                          minlength=len(centroids))
+            n_splits = min(k - len(centroids), len(centroids))
+            to_split = np.argsort(cluster_inertia)[::-1][:n_splits]
+
+            halves = []
+            for cl in to_split:
+                points = self.data[labels == cl]
+                if len(points) < 2:
+                    offset = np.zeros(centroids.shape[1])
+                else:
+                    offset = self.__principal_offset(points - centroids[cl])
+                halves.append(centroids[cl] + offset)
+                centroids[cl] -= offset
+            centroids = np.vstack([centroids] + halves)
+            if len(centroids) == k:
+                return centroids
+            labels, sq_dists = PairwiseDistanceCalculator(
+                vectors_1=self.data,
+                vectors_2=centroids,
+                norms_1=self.data_norms
+            ).compute_nearest()
+            sq_dists = np.maximum(sq_dists, 0)
+
+    @staticmethod
+    def __principal_offset(centered: np.ndarray,
+                           n_power_iter: int = 10)\
+            -> np.ndarray:
+        # power iteration for the largest eigenvector of the covariance
+        direction = centered[np.argmax(np.sum(centered ** 2, axis=1))].copy()
+        for _ in range(n_power_iter):
+            direction = centered.T @ (centered @ direction)
+            norm = np.linalg.norm(direction)
+            if norm == 0:
+                return np.zeros(centered.shape[1])
+            direction /= norm
+        return np.std(centered @ direction) * direction
+
+    def silhouette(self,
+                   labels: np.ndarray,
+                   sample: np.ndarray)\
+            -> float:
+        """
+        Silhouette score estimated on a sample of the points
+        :param np.ndarray labels: Cluster index of every point
+        :param np.ndarray sample: Indexes of the sampled points
+        :return float: Mean silhouette of the sampled points
+        """
+        points = np.asarray(self.data[sample], dtype=float)
+        sample_labels = labels[sample]
+        dists = np.sqrt(np.maximum(PairwiseDistanceCalculator(
+            vectors_1=points,
+            vectors_2=points,
+            norms_1=self.data_norms[sample]
+        ).compute_distance_no_loop(), 0))
+        np.fill_diagonal(dists, 0)
+
+        n_clusters = int(sample_labels.max()) + 1
+        counts = np.bincount(sample_labels, minlength=n_clusters)
+        one_hot = np.zeros((len(sample), n_clusters))
+        one_hot[np.arange(len(sample)), sample_labels] = 1
+        cluster_sums = dists @ one_hot  # distance sums to every cluster
+
+        rows = np.arange(len(sample))
+        own_counts = counts[sample_labels]
+        a = cluster_sums[rows, sample_labels] / np.maximum(own_counts - 1, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_others = cluster_sums / counts
+        mean_others[:, counts == 0] = np.inf
+        mean_others[rows, sample_labels] = np.inf
+        b = np.min(mean_others, axis=1)
+        scores = np.where(own_counts > 1, (b - a) / np.maximum(a, b), 0.0)
+        return float(np.mean(np.nan_to_num(scores)))
@@ -0,0 +1,121 @@
+import numpy as np
+
+from pairwise_distance_calculator import PairwiseDistanceCalculator
+
+
+class KDTreeAssignment:
+    """
+    Nearest centroid assignment through a KD-tree built over the centroids.
+    The centroids are split along the widest coordinate until the leaves hold
+    at most leaf_size of them, every leaf keeps its bounding box. A point only
+    visits the leaves (in increasing box distance) whose box is not farther
+    than the best centroid found so far, so for large k most of the n x k
+    distances are never computed.
+    """
+
+    # the tree pays off from this many centroids in low dimensions
+    min_k = 256
+    max_dim = 3
+
+    def __init__(self,
+                 centroids: np.ndarray,
+                 leaf_size: int = 16,
+                 block_rows: int = 65536)\
+            -> None:
+        """
+        Builds the tree over the centroids
+        :param np.ndarray centroids: Centroids, shape (k, d)
+        :param int leaf_size: Maximum number of centroids in a leaf
+        :param int block_rows: Number of points queried at once
+        :return: None
+        """
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.leaf_size = leaf_size
+        self.block_rows = block_rows
+        self.leaves = []  # centroid indexes of every leaf
+        self.__split(np.arange(len(self.centroids)))
+        self.lower = np.array([self.centroids[leaf].min(axis=0) for leaf in self.leaves])
+        self.upper = np.array([self.centroids[leaf].max(axis=0) for leaf in self.leaves])
+
+    @classmethod
+    def is_worth_it(cls,
+                    k: int,
+                    dim: int)\
+            -> bool:
+        """
+        Whether the tree is expected to beat the dense distance matrix
+        :param int k: Number of centroids
+        :param int dim: Dimension of the points
+        :return bool: True for large k in low dimensions
+        """
+        return k >= cls.min_k and dim <= cls.max_dim
+
+    def __split(self,
+                indexes: np.ndarray)\
+            -> None:
+        if len(indexes) <= self.leaf_size:
+            self.leaves.append(np.sort(indexes))
+            return
+        points = self.centroids[indexes]
+        axis = np.argmax(points.max(axis=0) - points.min(axis=0))
+        order = indexes[np.argsort(points[:, axis], kind="stable")]
+        middle = len(order) // 2
+        self.__split(order[:middle])
+        self.__split(order[middle:])
+
+    def query(self,
+              points: np.ndarray)\
+            -> tuple:
+        """
+        Nearest centroid of every point
+        :param np.ndarray points: Points, shape (n, d)
+        :return tuple: Nearest centroid indexes and squared distances
+        """
+        n_rows = len(points)
+        labels = np.empty(n_rows, dtype=np.int64)
+        dists = np.empty(n_rows)
+        for start in range(0, n_rows, self.block_rows):
+            stop = min(start + self.block_rows, n_rows)
+            labels[start:stop], dists[start:stop] = self.__query_block(
+                np.asarray(points[start:stop], dtype=float)
+            )
+        return labels, dists
+
+    def __query_block(self,
+                      points: np.ndarray)\
+            -> tuple:
+        n_rows = len(points)
+        # squared distance of every point from every leaf box
+        box_dists = np.zeros((n_rows, len(self.leaves)))
+        for dim in range(points.shape[1]):
+            coord = points[:, dim, None]
+            gap = np.maximum(self.lower[None, :, dim] - coord, coord - self.upper[None, :, dim])
+            box_dists += np.maximum(gap, 0) ** 2
+        visit_order = np.argsort(box_dists, axis=1)
+
+        best = np.full(n_rows, np.inf)
+        best_labels = np.full(n_rows, len(self.centroids), dtype=np.int64)
+        rows = np.arange(n_rows)
+        for rank in range(len(self.leaves)):
+            leaf_ids = visit_order[:, rank]
+            # equal distances are visited too, ties go to the lower index
+            active = np.flatnonzero(box_dists[rows, leaf_ids] <= best)
+            if len(active) == 0:
+                break
+            active = active[np.argsort(leaf_ids[active], kind="stable")]
+            leaf_starts = np.flatnonzero(np.diff(leaf_ids[active], prepend=-1))
+            for group in np.split(active, leaf_starts[1:]):
+                members = self.leaves[leaf_ids[group[0]]]
+                group_dists = PairwiseDistanceCalculator(
+                    vectors_1=points[group],
+                    vectors_2=self.centroids[members]
+                ).compute_distance_no_loop()
+                nearest = np.argmin(group_dists, axis=1)
+                candidate = group_dists[np.arange(len(group)), nearest]
+                candidate_labels = members[nearest]
+                better = (candidate < best[group]) | (
+                    (candidate == best[group]) & (candidate_labels < best_labels[group])
+                )
+                best[group[better]] = candidate[better]
+                best_labels[group[better]] = candidate_labels[better]
+        return best_labels, best
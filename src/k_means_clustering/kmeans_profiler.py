@@ -0,0 +1,109 @@
+import csv
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class KMeansProfiler:
+    """
+    Collects per-iteration timings of the named phases of KMeansClustering
+    (calculate_pairwise_distances, calculate_nearest_centroid_index,
+    calculate_nearest_centroids, group_by_index, calculate_centroids, ...),
+    the bytes they allocate and the label churn of every iteration.
+    Pass an instance as KMeansClustering(profiler=...), without one the
+    clustering does not measure anything.
+    """
+
+    def __init__(self,
+                 track_memory: bool = True)\
+            -> None:
+        """
+        :param bool track_memory: Whether to measure the allocated bytes with
+            tracemalloc (started on the first phase if it is not running)
+        :return: None
+        """
+        self.track_memory = track_memory
+        self.records = []  # one dict per iteration
+        self.__phases = dict()  # phase name -> [seconds, peak bytes]
+        self.__started_tracing = False
+
+    @contextmanager
+    def phase(self,
+              name: str):
+        """
+        Measures a phase, repeated phases within an iteration are summed
+        (e.g. the chunks of the streaming mode)
+        :param str name: Name of the phase
+        """
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+        if self.track_memory:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[1] - before \
+                if self.track_memory else 0
+            totals = self.__phases.setdefault(name, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] = max(totals[1], allocated)
+
+    def end_iteration(self,
+                      record: dict)\
+            -> dict:
+        """
+        Closes an iteration
+        :param dict record: History entry of the iteration (inertia, n_changed...)
+        :return dict: The record extended with <phase>_time and <phase>_bytes
+        """
+        record = dict(record)
+        for name, (seconds, allocated) in self.__phases.items():
+            record[f"{name}_time"] = seconds
+            record[f"{name}_bytes"] = allocated
+        self.__phases = dict()
+        self.records.append(record)
+        return record
+
+    def flush(self,
+              label: str)\
+            -> None:
+        """
+        Records the phases measured outside of the iterations (e.g. the final
+        assignment of the mini-batch mode), if there are any
+        :param str label: Value of the iteration field of the record
+        :return: None
+        """
+        if self.__phases:
+            self.end_iteration({"iteration": label})
+
+    def stop(self)\
+            -> None:
+        """
+        Stops tracemalloc if the profiler started it
+        :return: None
+        """
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    def export_json(self,
+                    file_path: str)\
+            -> None:
+        with open(file_path, "w") as f:
+            json.dump(self.records, f, indent=2)
+
+    def export_csv(self,
+                   file_path: str)\
+            -> None:
+        columns = []
+        for record in self.records:
+            columns += [key for key in record if key not in columns]
+        with open(file_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.records)
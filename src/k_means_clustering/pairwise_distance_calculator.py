@@ -1,20 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 
 class PairwiseDistanceCalculator:
-    def __init__(self, vectors_1, vectors_2):
+    # memory used by the temporaries of one block if no budget is given (bytes)
+    default_memory_budget = 64 * 2 ** 20
+
+    def __init__(self, vectors_1, vectors_2, dtype=None, memory_budget=None,
+                 norms_1=None):
+        """
+        Squared euclidean distances between two sets of vectors
+        :param np.ndarray vectors_1: First set of vectors, shape (n_1, d)
+        :param np.ndarray vectors_2: Second set of vectors, shape (n_2, d)
+        :param dtype: Floating point type of the computation (e.g. np.float32),
+            None keeps float64
+        :param int memory_budget: Size of the distance blocks in bytes for the
+            blocked methods
+        :param np.ndarray norms_1: Precomputed squared norms of vectors_1
+        """
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
         self.vectors_1 = vectors_1
-        self.vectors_2 = vectors_2
+        self.vectors_2 = np.asarray(vectors_2, dtype=self.dtype)
+        self.memory_budget = memory_budget or self.default_memory_budget
+        self.b2 = np.sum(self.vectors_2 ** 2, axis=1)  # dim = (n_2, )
+        self.norms_1 = norms_1
+
+    @property
+    def block_rows(self):
+        """
+        Number of rows of vectors_1 handled at once by the blocked methods
+        """
+        row_bytes = max(len(self.vectors_2), 1) * self.dtype.itemsize
+        return int(max(1, self.memory_budget // row_bytes))
 
-    def compute_distance_no_loop(self):
+    def compute_distance_no_loop(self, out=None):
+        return self.__compute_block(start=0,
+                                    stop=len(self.vectors_1),
+                                    out=out)
+
+    def compute_distance_blocked(self, out=None):
+        """
+        Full distance matrix computed block by block, so the temporaries never
+        exceed the memory budget
+        :param np.ndarray out: Preallocated (n_1, n_2) output buffer
+        :return np.ndarray: Distance matrix
+        """
         n_1 = len(self.vectors_1)
-        n_2 = len(self.vectors_2)
+        if out is None:
+            out = np.empty((n_1, len(self.vectors_2)), dtype=self.dtype)
+        for start in range(0, n_1, self.block_rows):
+            stop = min(start + self.block_rows, n_1)
+            self.__compute_block(start=start, stop=stop, out=out[start:stop])
+        return out
 
-        result = np.zeros((n_1, n_2))
+    def compute_nearest(self, out=None, n_threads=1):
+        """
+        Index of and squared distance to the nearest vector of vectors_2 for
+        every vector of vectors_1, without materialising the distance matrix
+        :param tuple out: Preallocated (indexes, distances) buffers of length n_1
+        :param int n_threads: Number of threads working on separate row blocks
+            (matmul and argmin release the GIL), the memory budget is shared
+            between them
+        :return tuple: Nearest indexes and their distances
+        """
+        n_1 = len(self.vectors_1)
+        if out is None:
+            out = (np.empty(n_1, dtype=np.int64), np.empty(n_1, dtype=self.dtype))
+        indexes, dists = out
+        n_threads = max(1, min(n_threads, n_1))
+        block_rows = max(1, min(self.block_rows // n_threads,
+                                -(-n_1 // n_threads)))
+        starts = list(range(0, n_1, block_rows))
+
+        def work(thread_starts):
+            block = np.empty((min(block_rows, n_1), len(self.vectors_2)),
+                             dtype=self.dtype)
+            for start in thread_starts:
+                self.__nearest_block(start=start,
+                                     stop=min(start + block_rows, n_1),
+                                     block=block,
+                                     indexes=indexes,
+                                     dists=dists)
+
+        if n_threads == 1:
+            work(starts)
+        else:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                # every thread reuses one block buffer for its share of blocks
+                list(executor.map(work, [starts[i::n_threads] for i in range(n_threads)]))
+        return indexes, dists
 
-        ab = self.vectors_1 @ self.vectors_2.T    #matrixok szorzas es transzponalt # dim = (n_1, n_2)
-        a2 = np.sum(self.vectors_1 ** 2, axis = 1).reshape((n_1, 1))  # dim = (n_1, 1) # reshape a broadcasting ignoralasa miatt kell
-        b2 = np.sum(self.vectors_2 ** 2, axis = 1)  # dim = (n_2, )
-        result = a2 - 2 * ab + b2
+    def __nearest_block(self, start, stop, block, indexes, dists):
+        block_dists = self.__compute_block(start=start,
+                                           stop=stop,
+                                           out=block[:stop - start])
+        np.argmin(block_dists, axis=1, out=indexes[start:stop])
+        dists[start:stop] = np.take_along_axis(
+            block_dists, indexes[start:stop, None], axis=1
+        )[:, 0]
+
+    def __compute_block(self, start, stop, out=None):
+        vectors_1 = np.asarray(self.vectors_1[start:stop], dtype=self.dtype)
+        n_1 = len(vectors_1)
+        n_2 = len(self.vectors_2)
+        if out is None:
+            out = np.empty((n_1, n_2), dtype=self.dtype)
 
-        return result
+        # in place: out = a2 - 2 * ab + b2 without full-size temporaries
+        np.matmul(vectors_1, self.vectors_2.T, out=out)  # ab, dim = (n_1, n_2)
+        out *= -2
+        if self.norms_1 is None:
+            a2 = np.sum(vectors_1 ** 2, axis=1)  # dim = (n_1, )
+        else:
+            a2 = np.asarray(self.norms_1[start:stop], dtype=self.dtype)
+        out += a2.reshape((n_1, 1))  # reshape a broadcasting ignoralasa miatt kell
+        out += self.b2
+        return out
@@ -0,0 +1,225 @@
+"""
+Matrix multiplication kernels of Matrix.__matmul__, working on plain
+sequences of rows and columns.
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from operator import add, mul, sub
+
+
+def dot_kernel(rows, columns):
+      """
+      Multiplies with one dot product per output element. Both operands are
+      read along contiguous sequences (the rows of the left matrix and the
+      columns of the right one, transposed in advance), the summation order
+      is the same as in the textbook triple loop.
+
+      Args:
+          rows: The rows of the left matrix.
+          columns: The columns of the right matrix.
+
+      Returns:
+          The rows of the product as lists.
+      """
+      return [[sum(map(mul, row, column)) for column in columns] for row in rows]
+
+
+def tiled_kernel(rows, columns, tile_size):
+      """
+      dot_kernel over tiles of tile_size columns: a tile is multiplied by all
+      the rows before the next one is read, so it stays in the cache.
+
+      Args:
+          rows: The rows of the left matrix.
+          columns: The columns of the right matrix.
+          tile_size: Number of columns in a tile.
+
+      Returns:
+          The rows of the product as lists.
+      """
+      result = [[] for _ in rows]
+      for start in range(0, len(columns), tile_size):
+          tile = columns[start:start + tile_size]
+          for row, out in zip(rows, result):
+              out.extend([sum(map(mul, row, column)) for column in tile])
+      return result
+
+
+def _add(left, right):
+      return [list(map(add, x, y)) for x, y in zip(left, right)]
+
+
+def _sub(left, right):
+      return [list(map(sub, x, y)) for x, y in zip(left, right)]
+
+
+def _split(rows, n_rows, n_cols):
+      half_r, half_c = n_rows // 2, n_cols // 2
+      return ([row[:half_c] for row in rows[:half_r]],
+              [row[half_c:] for row in rows[:half_r]],
+              [row[:half_c] for row in rows[half_r:]],
+              [row[half_c:] for row in rows[half_r:]])
+
+
+def _pad(rows, n_rows, n_cols):
+      """
+      Pads the rows with zeros to an even number of rows and columns.
+      """
+      if n_rows % 2 == 0 and n_cols % 2 == 0:
+          return rows
+      rows = [list(row) + [0] * (n_cols % 2) for row in rows]
+      if n_rows % 2:
+          rows.append([0] * (n_cols + n_cols % 2))
+      return rows
+
+
+def strassen(left, right, threshold):
+      """
+      Strassen's multiplication in Winograd's form (7 half-size products and
+      15 additions per level), recursing while every dimension is at least
+      threshold and multiplying the smaller blocks with dot_kernel. Odd
+      dimensions are padded with a zero row or column. The additions change
+      the rounding of floats, the result is exact for integers.
+
+      Args:
+          left: The rows of the left matrix.
+          right: The rows of the right matrix.
+          threshold: The smallest dimension still split.
+
+      Returns:
+          The rows of the product as lists.
+      """
+      m, k, p = len(left), len(right), len(right[0])
+      if min(m, k, p) < threshold:
+          return dot_kernel(left, list(zip(*right)))
+      a = _pad(left, m, k)
+      b = _pad(right, k, p)
+      a11, a12, a21, a22 = _split(a, m + m % 2, k + k % 2)
+      b11, b12, b21, b22 = _split(b, k + k % 2, p + p % 2)
+
+      s1 = _add(a21, a22)
+      s2 = _sub(s1, a11)
+      s3 = _sub(a11, a21)
+      s4 = _sub(a12, s2)
+      t1 = _sub(b12, b11)
+      t2 = _sub(b22, t1)
+      t3 = _sub(b22, b12)
+      t4 = _sub(t2, b21)
+
+      m1 = strassen(a11, b11, threshold)
+      m2 = strassen(a12, b21, threshold)
+      m3 = strassen(s4, b22, threshold)
+      m4 = strassen(a22, t4, threshold)
+      m5 = strassen(s1, t1, threshold)
+      m6 = strassen(s2, t2, threshold)
+      m7 = strassen(s3, t3, threshold)
+
+      u2 = _add(m1, m6)
+      u3 = _add(u2, m7)
+      u4 = _add(u2, m5)
+      c11 = _add(m1, m2)
+      c12 = _add(u4, m3)
+      c21 = _sub(u3, m4)
+      c22 = _add(u3, m5)
+
+      result = [x + y for x, y in zip(c11, c12)] + [x + y for x, y in zip(c21, c22)]
+      return [row[:p] for row in result[:m]]
+
+
+def parallel_kernel(rows, left_typecode, columns, right_typecode, shape, workers, tile_size):
+      """
+      dot_kernel over blocks of the product computed in a process pool. The
+      left matrix (row by row) and the right one (column by column) are
+      copied once into shared memory, the workers read them from there, so
+      the operands are never pickled. Every element is the same dot product
+      as in the serial kernels, so the result is bit-identical.
+
+      Args:
+          rows: The rows of the left matrix (arrays or memoryviews).
+          left_typecode: "q" or "d", the typecode of the rows.
+          columns: The columns of the right matrix (arrays or memoryviews).
+          right_typecode: "q" or "d", the typecode of the columns.
+          shape: Tuple (m, k, p), the left matrix is m x k, the right k x p.
+          workers: Number of worker processes.
+          tile_size: Number of columns of the right matrix in a tile.
+
+      Returns:
+          The rows of the product as lists.
+      """
+      m, k, p = shape
+      # row blocks, a few per worker for balance; split the columns too if
+      # there are fewer rows than workers
+      row_step = max(1, -(-m // (4 * workers)))
+      col_step = p if m >= workers else max(1, -(-p // workers))
+      blocks = [(r, min(r + row_step, m), c, min(c + col_step, p))
+                for r in range(0, m, row_step) for c in range(0, p, col_step)]
+      left = shared_memory.SharedMemory(create=True, size=8 * m * k)
+      right = shared_memory.SharedMemory(create=True, size=8 * k * p)
+      try:
+          for shm, typecode, vectors in ((left, left_typecode, rows),
+                                         (right, right_typecode, columns)):
+              view = shm.buf.cast(typecode)
+              for i, vector in enumerate(vectors):
+                  view[i * k:(i + 1) * k] = vector
+              view.release()
+          source = (left.name, left_typecode, right.name, right_typecode, k, tile_size)
+          with ProcessPoolExecutor(max_workers=workers) as executor:
+              results = list(executor.map(_multiply_block, [source] * len(blocks), blocks))
+      finally:
+          for shm in (left, right):
+              shm.close()
+              shm.unlink()
+
+      product = [[] for _ in range(m)]
+      for (row_start, _, _, _), block in zip(blocks, results):
+          for i, row in enumerate(block, row_start):
+              product[i].extend(row)
+      return product
+
+
+def _multiply_block(source, block):
+      """
+      One block of parallel_kernel in a worker process.
+
+      Args:
+          source: (left name, left typecode, right name, right typecode,
+              k, tile size) of the shared operands.
+          block: (first row, end row, first column, end column) of the block.
+
+      Returns:
+          The rows of the block as arrays (lists if integers overflow).
+      """
+      left_name, left_typecode, right_name, right_typecode, k, tile_size = source
+      row_start, row_end, col_start, col_end = block
+      left = shared_memory.SharedMemory(name=left_name)  # unlinked by the parent
+      right = shared_memory.SharedMemory(name=right_name)
+      try:
+          # copied out of the shared memory: iterating arrays is faster
+          rows = [_read(left.buf, left_typecode, i, k) for i in range(row_start, row_end)]
+          columns = [_read(right.buf, right_typecode, j, k) for j in range(col_start, col_end)]
+      finally:
+          left.close()
+          right.close()
+      if tile_size >= len(columns):
+          result = dot_kernel(rows, columns)
+      else:
+          result = tiled_kernel(rows, columns, tile_size)
+      typecode = "d" if "d" in (left_typecode, right_typecode) else "q"
+      packed = []
+      for row in result:
+          try:
+              packed.append(array(typecode, row))
+          except OverflowError:
+              packed.append(row)  # exact Python integers
+      return packed
+
+
+def _read(buffer, typecode, index, length):
+      """
+      Copies the index-th vector of length elements out of a shared buffer.
+      """
+      vector = array(typecode)
+      with buffer[8 * index * length:8 * (index + 1) * length] as chunk:
+          vector.frombytes(chunk)
+      return vector
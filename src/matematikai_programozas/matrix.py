@@ -1,17 +1,273 @@
+import operator
+import os
 import random
+import weakref
+from array import array
+from collections.abc import Sequence
+
+from src.matematikai_programozas.matmul import dot_kernel, parallel_kernel, strassen, tiled_kernel
+
 random.seed(42)
 
+
+def _pack(values, typecode=None):
+      """
+      Stores numbers in the most compact flat buffer that holds them exactly.
+
+      Args:
+          values: An iterable of numbers.
+          typecode: The typecode the values are known to fit ("d" for the
+              results of float arithmetic, "q" for integer arithmetic that
+              may still overflow), None to inspect the values.
+
+      Returns:
+          A tuple (buffer, typecode): an array('q') of 64-bit integers,
+          an array('d') of floats, or a plain list (typecode None) for
+          integers that do not fit into 64 bits and non-float numbers.
+      """
+      values = values if isinstance(values, list) else list(values)
+      if typecode == "d":
+          return array("d", values), "d"
+      try:
+          return array("q", values), "q"
+      except OverflowError:
+          return values, None
+      except TypeError:
+          if typecode == "q":
+              return values, None
+      if all(map(_is_float_exact, values)):
+          return array("d", values), "d"
+      return values, None
+
+
+def _result_typecode(left, right):
+      """
+      Returns the typecode of the result of arithmetic on two buffers:
+      "d" if any operand is a float, "q" for integers, None if unknown.
+      """
+      if left is None or right is None:
+          return None
+      return "d" if "d" in (left, right) else "q"
+
+
+def _is_float_exact(x):
+      """
+      Returns True if a float buffer stores the number without rounding.
+      """
+      return isinstance(x, float) or (isinstance(x, int) and abs(x) < 2 ** 53)
+
+
+def _import_numpy():
+      """
+      Returns the numpy module, or None if it is not installed.
+      """
+      try:
+          import numpy
+      except ImportError:
+          return None
+      return numpy
+
+
+def _max_abs(x):
+      """
+      Returns the largest absolute value of a NumPy array or a scalar
+      as a Python number.
+      """
+      if not hasattr(x, "size"):
+          return abs(x)
+      return max(abs(int(x.max())), abs(int(x.min()))) if x.size else 0
+
+
+def _base(buffer):
+      """
+      Returns the object owning the memory of a buffer (the exporter of a
+      memoryview), the same for a matrix and all its views.
+      """
+      return buffer.obj if isinstance(buffer, memoryview) else buffer
+
+
+# unevaluated expressions reading a buffer (weakly, by their id) by id of its
+# _base: they are evaluated before the buffer is written (Matrix._before_write);
+# those reading an unevaluated expression are kept by its id until it has a result
+_dependents = {}
+
+
+def _check_out(out, shape):
+      """
+      Checks that an output matrix can hold a result of the given shape.
+
+      Returns:
+          The Matrix to write into (the evaluated result of an expression).
+
+      Raises:
+          TypeError: If out is not a Matrix or a MatrixExpression.
+          ValueError: If out has a different shape.
+      """
+      if isinstance(out, MatrixExpression):
+          out = out.evaluate()
+      if not isinstance(out, Matrix):
+          raise TypeError("The output must be a Matrix.")
+      if out.shape != shape:
+          raise ValueError("The output must have the shape of the result.")
+      return out
+
+
+def _span(index, length):
+      """
+      Resolves an integer or slice index along an axis of a matrix.
+
+      Args:
+          index: An integer (negative counts from the end) or a slice
+              with a positive step.
+          length: The length of the axis.
+
+      Returns:
+          A tuple (start, count, step).
+
+      Raises:
+          IndexError: If the integer is out of range or the slice is empty.
+          ValueError: If the slice step is not positive.
+      """
+      if isinstance(index, slice):
+          start, stop, step = index.indices(length)
+          if step < 1:
+              raise ValueError("Only positive slice steps are supported.")
+          count = len(range(start, stop, step))
+          if count == 0:
+              raise IndexError("A matrix view must not be empty.")
+          return start, count, step
+      if index < 0:
+          index += length
+      if not 0 <= index < length:
+          raise IndexError("Matrix index out of range.")
+      return index, 1, 1
+
+
+# element-wise operators: (NumPy function used by _delegate, Python function)
+_OPERATIONS = {
+      "+": ("add", operator.add),
+      "-": ("subtract", operator.sub),
+      "*": ("multiply", operator.mul),
+}
+
+
+class _Row(Sequence):
+      """
+      A row of Matrix.data: reads and writes the elements of the matrix
+      itself (m.data[i][j] = x sets element (i, j)), nothing is copied.
+      """
+      __slots__ = ("_matrix", "_i")
+
+      def __init__(self, matrix, i):
+          self._matrix = matrix
+          self._i = i
+
+      def __len__(self):
+          return self._matrix._shape[1]
+
+      def __getitem__(self, j):
+          if isinstance(j, slice):
+              return [self._matrix[self._i, k] for k in range(*j.indices(len(self)))]
+          return self._matrix[self._i, j]
+
+      def __setitem__(self, j, value):
+          if isinstance(j, slice):
+              positions = range(*j.indices(len(self)))
+              value = list(value)
+              if len(value) != len(positions):
+                  raise ValueError("The assigned values must match the length of the slice.")
+              for k, x in zip(positions, value):
+                  self._matrix[self._i, k] = x
+              return
+          self._matrix[self._i, j] = value
+
+      def __iter__(self):
+          return iter(self._matrix._row(self._i))
+
+      def __eq__(self, other):
+          if isinstance(other, (list, tuple, _Row)):
+              return list(self) == list(other)
+          return NotImplemented
+
+      def __repr__(self):
+          return repr(list(self))
+
+
+class _Rows(Sequence):
+      """
+      The rows of a matrix as returned by Matrix.data, created on indexing.
+      """
+      __slots__ = ("_matrix",)
+
+      def __init__(self, matrix):
+          self._matrix = matrix
+
+      def __len__(self):
+          return self._matrix._shape[0]
+
+      def __getitem__(self, i):
+          rows = len(self)
+          if isinstance(i, slice):
+              return [_Row(self._matrix, k) for k in range(*i.indices(rows))]
+          if i < 0:
+              i += rows
+          if not 0 <= i < rows:
+              raise IndexError("Matrix index out of range.")
+          return _Row(self._matrix, i)
+
+      def __eq__(self, other):
+          if isinstance(other, (list, tuple, _Rows)):
+              return len(self) == len(other) and all(
+                  row == other_row for row, other_row in zip(self, other)
+              )
+          return NotImplemented
+
+      def __repr__(self):
+          return repr([list(row) for row in self._matrix.rows()])
+
+
 # HINT FOR OPERATORS: https://docs.python.org/3/reference/datamodel.html#emulating-numeric-types
 class Matrix:
       """
-      A class to represent a matrix using nested lists.
+      A class to represent a matrix stored in one flat buffer.
+
+      The elements live in a contiguous array('q') (integers) or array('d')
+      (floats); element (i, j) is at offset + i * strides[0] + j * strides[1].
+      The data property still gives nested access, m.data[i][j], to the elements.
+      The buffer may also be the memory of a NumPy array or of any other
+      buffer (from_buffer, from_numpy), np.asarray(matrix) shares it back.
+      Transposes (get_transposed) and windows (A[1:3, :], A[:, 0]) are views:
+      matrices with their own shape, strides and offset on the same buffer.
+      Only a matrix owning its buffer widens it to a copy when a value does
+      not fit (floats into integers, integers beyond 64 bits); views and
+      shared memory raise a TypeError instead of detaching.
       """
+      __slots__ = ("_buffer", "_typecode", "_shape", "_strides", "_offset", "_owned")
+
+      # serial integer products with every dimension at least this large use
+      # Strassen (in pure Python it only pays off from about 1024 up)
+      strassen_threshold = 1024
+      # size of the column tiles of the right operand kept in the cache
+      tile_bytes = 256 * 1024
+      # "python", "numpy" (delegate +, -, * and @ to NumPy) or "auto" (NumPy
+      # for matrices of at least numpy_threshold elements, if it is installed)
+      backend = "python"
+      numpy_threshold = 4096
+      # number of processes of @ (None: all the cores, 1: serial), used for
+      # products of at least parallel_threshold multiplications (m * k * p)
+      workers = 1
+      parallel_threshold = 2 ** 24
+      # True: +, - and * build MatrixExpression trees evaluated in one fused
+      # pass when the result is needed (operations on expressions are always lazy)
+      lazy = False
+
       def __init__(self, data):
           """
           Constructor for the Matrix class.
 
           Args:
-              data: A list of lists representing the matrix.
+              data: A list of lists representing the matrix (the rows may
+                  also be tuples, or the rows of another matrix's data).
 
           Raises:
               ValueError: If the input is not a rectangular table.
@@ -24,16 +280,569 @@ class Matrix:
               .join():  It works with an iterable (like a list, tuple, or set) of strings
                         and concatenates the elements of the iterable into a single string.
 
-              .data[0]: This gets the number of columns in the matrix
-                        by checking the length of its first row.
+              _pack():  Packs the elements, row after row, into one flat
+                        array('q') or array('d') (a list for other numbers);
+                        the number of columns is the length of the first row.
           """
           if not data or not all(
-              isinstance(row, list) and len(row) == len(data[0]) for row in data
+              isinstance(row, (list, tuple, _Row)) and len(row) == len(data[0])
+              for row in data
           ):
               raise ValueError("Input must be a rectangular table.")
 
+          buffer, typecode = _pack([x for row in data for x in row])
+          self._set_storage(buffer, typecode, (len(data), len(data[0])))
+
+      def _set_storage(self, buffer, typecode, shape, strides=None, offset=0, owned=True):
+          """
+          Points the matrix to a flat buffer.
+
+          Args:
+              buffer: The flat buffer (array, memoryview or list).
+              typecode: "q", "d" or None for a plain list.
+              shape: Tuple (rows, columns).
+              strides: Tuple (row stride, column stride) in elements,
+                  row-major contiguous by default.
+              offset: Index of element (0, 0) in the buffer.
+              owned: False if the buffer belongs to another matrix (a view)
+                  or to foreign memory, so it must not be replaced.
+          """
+          self._buffer = buffer
+          self._typecode = typecode
+          self._shape = shape
+          self._strides = (shape[1], 1) if strides is None else strides
+          self._offset = offset
+          self._owned = owned
 
-          self.data = data
+      @classmethod
+      def _wrap(cls, buffer, typecode, shape, strides=None, offset=0, owned=True):
+          """
+          Creates a matrix on an existing flat buffer without validation
+          or copying.
+
+          Returns:
+              A new Matrix object sharing the buffer.
+          """
+          matrix = cls.__new__(cls)
+          matrix._set_storage(buffer, typecode, shape, strides, offset, owned)
+          return matrix
+
+      @classmethod
+      def _from_values(cls, values, shape, typecode=None):
+          """
+          Creates a contiguous matrix from row-major values.
+
+          Args:
+              values: The elements in row-major order.
+              shape: Tuple (rows, columns).
+              typecode: The typecode the values are known to fit, see _pack.
+
+          Returns:
+              A new Matrix object.
+          """
+          buffer, typecode = _pack(values, typecode)
+          return cls._wrap(buffer, typecode, shape)
+
+      @classmethod
+      def from_buffer(cls, buffer, shape):
+          """
+          Creates a matrix sharing the memory of a buffer (e.g. an array,
+          a NumPy array or shared memory) without copying.
+
+          Args:
+              buffer: A C-contiguous buffer of 64-bit floats or integers.
+              shape: Tuple (rows, columns).
+
+          Returns:
+              A new Matrix object, changing it changes the buffer.
+
+          Raises:
+              ValueError: If the buffer is not C-contiguous, does not hold
+                  64-bit numbers or its size does not match the shape.
+          """
+          view = memoryview(buffer)
+          if not view.c_contiguous:
+              raise ValueError("The buffer must be C-contiguous.")
+          fmt = view.format.lstrip("@=")
+          if view.itemsize == 8 and fmt == "d":
+              typecode = "d"
+          elif view.itemsize == 8 and fmt in ("q", "l"):
+              typecode = "q"
+          else:
+              raise ValueError("Only buffers of 64-bit floats or integers can be shared.")
+          flat = view.cast("B").cast(typecode)
+          rows, cols = shape
+          if rows < 1 or cols < 1 or len(flat) != rows * cols:
+              raise ValueError("The buffer size does not match the shape.")
+          return cls._wrap(flat, typecode, (rows, cols), owned=False)
+
+      @classmethod
+      def from_numpy(cls, ndarray):
+          """
+          Creates a matrix from a 2-dimensional NumPy array. C-contiguous
+          float64 and int64 arrays are shared without copying, other arrays
+          are converted (copied) first.
+
+          Args:
+              ndarray: A 2-dimensional NumPy array.
+
+          Returns:
+              A new Matrix object.
+
+          Raises:
+              ValueError: If the array is not 2-dimensional, empty or not numeric.
+          """
+          if ndarray.ndim != 2 or ndarray.size == 0:
+              raise ValueError("Only non-empty 2-dimensional arrays can be converted.")
+          if ndarray.dtype.kind in "biu":
+              ndarray = ndarray.astype("int64", order="C", copy=False)
+          elif ndarray.dtype.kind == "f":
+              ndarray = ndarray.astype("float64", order="C", copy=False)
+          else:
+              raise ValueError("Only arrays of numbers can be converted.")
+          return cls.from_buffer(ndarray, ndarray.shape)
+
+      def as_memoryview(self):
+          """
+          Returns a 2-dimensional memoryview of the elements (no copy).
+
+          Raises:
+              BufferError: If the matrix is not contiguous or holds Python
+                  numbers outside the 64-bit range.
+          """
+          if self._typecode is None:
+              raise BufferError("Only matrices of 64-bit numbers export a buffer.")
+          if not self.is_contiguous():
+              raise BufferError("Only contiguous matrices export a buffer.")
+          size = self._shape[0] * self._shape[1]
+          view = memoryview(self._buffer)[self._offset:self._offset + size]
+          return view.cast("B").cast(self._typecode, self._shape)
+
+      def __buffer__(self, flags):
+          """
+          Buffer protocol (Python 3.12+): memoryview(matrix).
+          """
+          return self.as_memoryview()
+
+      def __array__(self, dtype=None, copy=None):
+          """
+          NumPy interface: np.asarray(matrix) shares the memory of the matrix
+          (also of a strided one) instead of copying it.
+
+          Args:
+              dtype: The requested NumPy dtype.
+              copy: True to copy, False to fail instead of copying.
+
+          Returns:
+              A 2-dimensional NumPy array.
+
+          Raises:
+              ValueError: If copy is False but the array cannot be shared.
+          """
+          np = _import_numpy()
+          if self._typecode is None:
+              if copy is False:
+                  raise ValueError("A matrix of Python numbers cannot be shared.")
+              return np.array([list(row) for row in self.rows()], dtype=dtype)
+          result = np.ndarray(self._shape,
+                              dtype=np.int64 if self._typecode == "q" else np.float64,
+                              buffer=self._buffer,
+                              offset=8 * self._offset,
+                              strides=(8 * self._strides[0], 8 * self._strides[1]))
+          if dtype is not None and result.dtype != np.dtype(dtype):
+              if copy is False:
+                  raise ValueError("The matrix cannot be shared with another dtype.")
+              return result.astype(dtype)
+          return result.copy() if copy else result
+
+      def _delegate(self, op, other, out=None):
+          """
+          Runs an operator with NumPy if the backend asks for it. Integer
+          operations that might overflow 64 bits stay in Python.
+
+          Args:
+              op: "add", "subtract", "multiply" or "matmul".
+              other: The other operand, a Matrix or a constant.
+              out: A Matrix to write the result into, None for a new one.
+                  NumPy writes into it directly if its buffer has the
+                  dtype of the result.
+
+          Returns:
+              The result Matrix (out if given), or None if the operation
+              stays in Python.
+
+          Raises:
+              ImportError: If the backend is "numpy" but NumPy is not installed.
+          """
+          if self.backend == "python" or self._typecode is None \
+                  or (isinstance(other, Matrix) and other._typecode is None):
+              return None
+          if self.backend == "auto" and \
+                  self._shape[0] * self._shape[1] < self.numpy_threshold:
+              return None
+          np = _import_numpy()
+          if np is None:
+              if self.backend == "numpy":
+                  raise ImportError("The numpy backend of Matrix needs NumPy.")
+              return None
+          left = np.asarray(self)
+          right = np.asarray(other) if isinstance(other, Matrix) else other
+          if self._typecode == "q" and not isinstance(other, float) \
+                  and getattr(other, "_typecode", "q") == "q":
+              left_max, right_max = _max_abs(left), _max_abs(right)
+              if op == "add" or op == "subtract":
+                  bound = left_max + right_max
+              else:
+                  bound = left_max * right_max * (self._shape[1] if op == "matmul" else 1)
+              if max(bound, right_max) >= 2 ** 63:
+                  return None
+          if out is None:
+              return Matrix.from_numpy(getattr(np, op)(left, right))
+          right_typecode = other._typecode if isinstance(other, Matrix) \
+              else "d" if isinstance(other, float) else "q"
+          if out._typecode == _result_typecode(self._typecode, right_typecode):
+              out._before_write()
+              getattr(np, op)(left, right, out=np.asarray(out))  # overlap is handled by NumPy
+          else:
+              result = Matrix.from_numpy(getattr(np, op)(left, right))
+              out._assign(result.flat(), result._typecode)
+          return out
+
+      def is_contiguous(self):
+          """
+          Returns True if the elements are stored row by row without gaps.
+          """
+          rows, cols = self._shape
+          row_stride, col_stride = self._strides
+          return (cols == 1 or col_stride == 1) and (rows == 1 or row_stride == cols)
+
+      def shares_memory(self, other):
+          """
+          Returns True if the two matrices are stored in the same buffer
+          (e.g. a matrix and its views).
+          """
+          return _base(self._buffer) is _base(other._buffer)
+
+      def _before_write(self):
+          """
+          Evaluates the pending expressions reading the buffer, so they keep
+          the values it had when they were built, as in eager mode.
+          """
+          dependents = _dependents.pop(id(_base(self._buffer)), None)
+          if dependents:
+              for expression in list(dependents.values()):
+                  expression.evaluate()
+
+      def copy(self):
+          """
+          Returns a contiguous copy of the matrix (e.g. to materialise a view).
+          """
+          values = self.flat()
+          values = list(values) if self._typecode is None else array(self._typecode, values)
+          return Matrix._wrap(values, self._typecode, self._shape)
+
+      def flat(self):
+          """
+          Returns the elements in row-major order.
+
+          Returns:
+              The buffer itself (or a slice of it) for a contiguous matrix,
+              otherwise a new array (a list for Python numbers).
+          """
+          rows, cols = self._shape
+          if self.is_contiguous():
+              if self._offset == 0 and len(self._buffer) == rows * cols:
+                  return self._buffer
+              return self._buffer[self._offset:self._offset + rows * cols]
+          values = [] if self._typecode is None else array(self._typecode)
+          for row in self.rows():
+              values.extend(row)  # strided slices, copied in C
+          return values
+
+      def _row(self, i):
+          """
+          Returns row i (0 <= i < rows) as a flat sequence.
+          """
+          cols = self._shape[1]
+          col_stride = self._strides[1]
+          start = self._offset + i * self._strides[0]
+          return self._buffer[start:start + cols * col_stride:col_stride]
+
+      def rows(self):
+          """
+          Yields the rows of the matrix as flat sequences.
+          """
+          cols = self._shape[1]
+          row_stride, col_stride = self._strides
+          start = self._offset
+          for _ in range(self._shape[0]):
+              yield self._buffer[start:start + cols * col_stride:col_stride]
+              start += row_stride
+
+      def columns(self):
+          """
+          Yields the columns of the matrix as flat sequences.
+          """
+          rows = self._shape[0]
+          row_stride, col_stride = self._strides
+          start = self._offset
+          for _ in range(self._shape[1]):
+              yield self._buffer[start:start + rows * row_stride:row_stride]
+              start += col_stride
+
+      def _fit(self, values, typecode=None):
+          """
+          Converts row-major values to the element type of the buffer.
+
+          Args:
+              values: The elements in row-major order.
+              typecode: The typecode the values are known to fit, see _pack.
+
+          Returns:
+              The values ready for _write, or None if the buffer cannot hold
+              them exactly.
+          """
+          if self._typecode is None:
+              return values
+          if self._typecode == "q" and typecode == "d":
+              return None
+          if self._typecode == "d" and typecode != "d" \
+                  and not all(map(_is_float_exact, values)):
+              return None
+          if isinstance(values, array) and values.typecode == self._typecode:
+              return values
+          try:
+              return array(self._typecode, values)
+          except (TypeError, OverflowError):
+              return None
+
+      def _write(self, values):
+          """
+          Writes row-major values (converted by _fit) into the buffer.
+          """
+          rows, cols = self._shape
+          if self.is_contiguous():
+              self._buffer[self._offset:self._offset + rows * cols] = values
+              return
+          row_stride, col_stride = self._strides
+          start = self._offset
+          for i in range(0, rows * cols, cols):
+              self._buffer[start:start + cols * col_stride:col_stride] = values[i:i + cols]
+              start += row_stride
+
+      def _assign(self, values, typecode=None):
+          """
+          Writes row-major values into the elements of the matrix. They are
+          written into its own buffer (shared memory stays shared) if they
+          fit it, otherwise the buffer is widened to a copy like in
+          __setitem__.
+
+          Args:
+              values: The elements in row-major order, computed in full
+                  (so they may come from the matrix itself).
+              typecode: The typecode the values are known to fit, see _pack.
+
+          Raises:
+              TypeError: If the values do not fit a buffer the matrix does
+                  not own.
+          """
+          self._before_write()
+          fitted = self._fit(values, typecode)
+          if fitted is None:
+              self._widen(values, typecode)
+              return
+          self._write(fitted)
+
+      def _widen(self, values, typecode=None):
+          """
+          Replaces the buffer by a wider copy holding the row-major values.
+
+          Raises:
+              TypeError: If the matrix does not own its buffer (a view or
+                  shared memory), a copy would detach it from the memory.
+          """
+          if not self._owned:
+              raise TypeError(
+                  "The values do not fit the shared buffer of the matrix."
+              )
+          buffer, typecode = _pack(values, typecode)
+          self._set_storage(buffer, typecode, self._shape)
+
+      def _write_rows(self, rows, typecode=None):
+          """
+          Writes the rows of the result one by one, so only one row is held
+          in memory. If a row does not fit the buffer, the rest of the rows
+          are collected and the buffer is widened by _assign.
+
+          Args:
+              rows: An iterable of the rows (lists of values), computed
+                  lazily from operands that do not overlap the matrix or
+                  are laid out like it (row i is read before it is written).
+              typecode: The typecode the values are known to fit, see _pack.
+
+          Raises:
+              TypeError: If a row does not fit a buffer the matrix does not
+                  own (the rows before it are written already).
+          """
+          self._before_write()
+          cols = self._shape[1]
+          row_stride, col_stride = self._strides
+          start = self._offset
+          rows = iter(rows)
+          for i, row in enumerate(rows):
+              fitted = self._fit(row, typecode)
+              if fitted is None:
+                  values = list(self.flat())[:i * cols]
+                  values.extend(row)
+                  for row in rows:
+                      values.extend(row)
+                  self._assign(values)
+                  return
+              self._buffer[start:start + cols * col_stride:col_stride] = fitted
+              start += row_stride
+
+      @property
+      def data(self):
+          """
+          Returns the rows of the matrix without copying it: m.data[i][j]
+          reads and m.data[i][j] = x writes element (i, j) of the matrix.
+          Assigning a list of lists to data replaces the whole matrix; a
+          view or a matrix on shared memory keeps its buffer and shape, the
+          values are written into it.
+          """
+          return _Rows(self)
+
+      @data.setter
+      def data(self, data):
+          if self._owned:
+              self._before_write()
+              self.__init__(data)
+              return
+          value = Matrix(data)
+          if value.shape != self._shape:
+              raise ValueError("The assigned data must have the shape of the matrix.")
+          self._assign(value.flat(), value._typecode)
+
+      def _view(self, i, j):
+          """
+          Returns the view selected by a row index and a column index
+          (integers or slices), sharing the buffer.
+          """
+          row_start, rows, row_step = _span(i, self._shape[0])
+          col_start, cols, col_step = _span(j, self._shape[1])
+          row_stride, col_stride = self._strides
+          return Matrix._wrap(self._buffer,
+                              self._typecode,
+                              (rows, cols),
+                              (row_stride * row_step, col_stride * col_step),
+                              self._offset + row_start * row_stride + col_start * col_stride,
+                              owned=False)
+
+      def __getitem__(self, index):
+          """
+          Returns the element at the given (row, column) position, or a view
+          if any of the indices is a slice (A[1:3, :], A[0, :], A[:, ::2]).
+
+          Args:
+              index: A tuple (i, j) of integers (negative indices count from
+                  the end) or slices with a positive step.
+
+          Raises:
+              IndexError: If the position is outside the matrix or the
+                  selected window is empty.
+          """
+          i, j = index
+          rows, cols = self._shape
+          try:
+              inside = 0 <= i < rows and 0 <= j < cols
+          except TypeError:
+              return self._view(i, j)  # a slice
+          if not inside:
+              if isinstance(i, slice) or isinstance(j, slice):
+                  return self._view(i, j)
+              if i < 0:
+                  i += rows
+              if j < 0:
+                  j += cols
+              if not (0 <= i < rows and 0 <= j < cols):
+                  raise IndexError("Matrix index out of range.")
+          row_stride, col_stride = self._strides
+          return self._buffer[self._offset + i * row_stride + j * col_stride]
+
+      def __setitem__(self, index, value):
+          """
+          Sets the element at the given (row, column) position, or all the
+          elements of a window if any of the indices is a slice.
+
+          Args:
+              index: A tuple (i, j) of integers (negative indices count from
+                  the end) or slices with a positive step.
+              value: The new element, or for a window a Matrix of its shape
+                  or a constant.
+
+          Raises:
+              IndexError: If the position is outside the matrix.
+              ValueError: If the assigned matrix has a different shape than
+                  the window.
+              TypeError: If the value does not fit a buffer the matrix does
+                  not own (a view or shared memory).
+          """
+          i, j = index
+          if isinstance(i, slice) or isinstance(j, slice):
+              self._set_window(i, j, value)
+              return
+          rows, cols = self._shape
+          if i < 0:
+              i += rows
+          if j < 0:
+              j += cols
+          if not (0 <= i < rows and 0 <= j < cols):
+              raise IndexError("Matrix index out of range.")
+          self._before_write()
+          position = self._offset + i * self._strides[0] + j * self._strides[1]
+          if self._typecode != "d" or _is_float_exact(value):
+              try:
+                  self._buffer[position] = value
+                  return
+              except (TypeError, OverflowError):
+                  pass
+          # the value does not fit the buffer, widen it to a copy
+          values = list(self.flat())
+          values[i * cols + j] = value
+          self._widen(values)
+
+      def _set_window(self, i, j, value):
+          """
+          Writes a Matrix or a constant into the window A[i, j]. This is also
+          the last step of an in-place operator on a window (A[1:3, :] += B).
+          """
+          view = self._view(i, j)
+          if isinstance(value, MatrixExpression):
+              value = value.evaluate()
+          if isinstance(value, Matrix):
+              if value.shape != view.shape:
+                  raise ValueError("The assigned matrix must have the shape of the window.")
+              if view.shares_memory(value) and value._offset == view._offset \
+                      and value._strides == view._strides:
+                  return  # written in place already
+              values, typecode = value.flat(), value._typecode
+          else:
+              values = [value] * (view.shape[0] * view.shape[1])
+              typecode = "d" if isinstance(value, float) else "q" if isinstance(value, int) else None
+          self._before_write()
+          fitted = view._fit(values, typecode)
+          if fitted is not None:
+              view._write(fitted)
+              return
+          # the values do not fit the buffer, widen it to a list, then repack it
+          if not self._owned:
+              raise TypeError(
+                  "The values do not fit the shared buffer of the matrix."
+              )
+          self._set_storage(list(self.flat()), None, self._shape)
+          self._view(i, j)._write(values)
+          buffer, typecode = _pack(self._buffer)
+          self._set_storage(buffer, typecode, self._shape)
 
       def __str__(self):
           """
@@ -41,97 +850,201 @@ class Matrix:
           with elements rounded to 4 digits.
           """
           return "\n".join(
-              [" ".join([f"{x:.4f}" for x in row]) for row in self.data]
+              [" ".join([f"{x:.4f}" for x in row]) for row in self.rows()]
           )
 
-      def __add__(self, other):
+      def _elementwise(self, other, symbol, out=None):
           """
-          Overloads the addition operator for matrix addition.
+          Applies an element-wise operator (the shapes are already checked).
+
+          Args:
+              other: A Matrix, a MatrixExpression or a constant (for "*").
+              symbol: "+", "-" or "*".
+              out: A Matrix to write the result into, None for a new one.
+
+          Returns:
+              out or a new Matrix object.
+          """
+          if out is not None:
+              out = _check_out(out, self._shape)
+          if isinstance(other, MatrixExpression):
+              # the operator is fused into the kernel of the expression,
+              # which is internal: out need not evaluate it before the write
+              expression = MatrixExpression(symbol, self, other)
+              expression._release()
+              return expression.evaluate(out)
+          name, function = _OPERATIONS[symbol]
+          result = self._delegate(name, other, out)
+          if result is not None:
+              return result
+          if isinstance(other, Matrix):
+              operands, other_typecode = [self, other], other._typecode
+          else:
+              operands, other_typecode = [self], "d" if isinstance(other, float) else "q"
+          typecode = _result_typecode(self._typecode, other_typecode)
+          if out is not None and not (out._typecode == "q" and typecode == "d") \
+                  and all(not out.shares_memory(operand)
+                          or (operand._offset, operand._strides) == (out._offset, out._strides)
+                          for operand in operands):
+              # row by row into the buffer of out, the temporary is one row
+              if isinstance(other, Matrix):
+                  rows = (list(map(function, x, y)) for x, y in zip(self.rows(), other.rows()))
+              else:
+                  rows = ([x * other for x in row] for row in self.rows())
+              out._write_rows(rows, typecode)
+              return out
+          if isinstance(other, Matrix):
+              values = list(map(function, self.flat(), other.flat()))
+          else:
+              values = [x * other for x in self.flat()]
+          if out is None:
+              return Matrix._from_values(values, self._shape, typecode)
+          # out overlaps an operand with another layout or must be widened
+          out._assign(values, typecode)
+          return out
+
+      def add(self, other, out=None):
+          """
+          Matrix addition, optionally into an existing matrix.
 
           Args:
               other: Another Matrix object.
+              out: A Matrix of the same shape to write the sum into (it may
+                  be self or other), None for a new matrix.
 
           Returns:
-              A new Matrix object representing the sum of the two matrices.
+              out, or a new Matrix object (a MatrixExpression in lazy mode).
 
           Raises:
               ValueError: If the matrices have different dimensions.
           """
-          if len(self.data) != len(other.data) or \
-             len(self.data[0]) != len(other.data[0]):
+          if self._shape != other.shape:
               raise ValueError(
                   "Matrices must have the same dimensions for addition."
               )
-          result_data = [
-              [self.data[i][j] + other.data[i][j]
-               for j in range(len(self.data[0]))]
-              for i in range(len(self.data))
-          ]
-          return Matrix(result_data)
+          if out is None and (self.lazy or isinstance(other, MatrixExpression)):
+              return MatrixExpression("+", self, other)
+          return self._elementwise(other, "+", out)
 
-      def __sub__(self, other):
+      def sub(self, other, out=None):
           """
-          Overloads the subtraction operator for matrix subtraction.
+          Matrix subtraction, optionally into an existing matrix.
 
           Args:
               other: Another Matrix object.
+              out: A Matrix of the same shape to write the difference into
+                  (it may be self or other), None for a new matrix.
 
           Returns:
-                A new Matrix object representing the difference of the two matrices.
+              out, or a new Matrix object (a MatrixExpression in lazy mode).
 
-            Raises:
-                ValueError: If the matrices have different dimensions.
-            """
-          if len(self.data) != len(other.data) or \
-             len(self.data[0]) != len(other.data[0]):
+          Raises:
+              ValueError: If the matrices have different dimensions.
+          """
+          if self._shape != other.shape:
               raise ValueError(
                   "Matrices must have the same dimensions for subtraction."
               )
-          result_data = [
-              [self.data[i][j] - other.data[i][j]
-               for j in range(len(self.data[0]))]
-              for i in range(len(self.data))
-          ]
-          return Matrix(result_data)
+          if out is None and (self.lazy or isinstance(other, MatrixExpression)):
+              return MatrixExpression("-", self, other)
+          return self._elementwise(other, "-", out)
 
-      def __mul__(self, other):
+      def mul(self, other, out=None):
           """
-          Overloads the multiplication operator
-          for element-wise multiplication or scalar multiplication.
+          Element-wise or scalar multiplication, optionally into an existing
+          matrix.
 
           Args:
               other: Another Matrix object or a constant (int or float).
+              out: A Matrix of the same shape to write the product into (it
+                  may be self or other), None for a new matrix.
 
           Returns:
-              A new Matrix object representing the product.
+              out, or a new Matrix object (a MatrixExpression in lazy mode).
 
           Raises:
               ValueError: If the other operand is a Matrix with different dimensions.
               TypeError: If the other operand is not a Matrix, int, or float.
           """
-          if isinstance(other, Matrix):
-              if len(self.data) != len(other.data) or \
-                 len(self.data[0]) != len(other.data[0]):
+          if isinstance(other, (Matrix, MatrixExpression)):
+              if self._shape != other.shape:
                   raise ValueError(
                       "Matrices must have the same dimensions for "
                       "element-wise multiplication."
                   )
-              result_data = [
-                  [self.data[i][j] * other.data[i][j]
-                   for j in range(len(self.data[0]))]
-                  for i in range(len(self.data))
-              ]
-              return Matrix(result_data)
-          elif isinstance(other, (int, float)):
-              result_data = [
-                  [self.data[i][j] * other for j in range(len(self.data[0]))]
-                  for i in range(len(self.data))
-              ]
-              return Matrix(result_data)
-          else:
+          elif not isinstance(other, (int, float)):
               raise TypeError(
                   "Operand must be a Matrix or a constant (int or float)."
               )
+          if out is None and (self.lazy or isinstance(other, MatrixExpression)):
+              return MatrixExpression("*", self, other)
+          return self._elementwise(other, "*", out)
+
+      def __add__(self, other):
+          """
+          Overloads the addition operator for matrix addition.
+
+          Args:
+              other: Another Matrix object.
+
+          Returns:
+              A new Matrix object representing the sum of the two matrices.
+
+          Raises:
+              ValueError: If the matrices have different dimensions.
+          """
+          return self.add(other)
+
+      def __sub__(self, other):
+          """
+          Overloads the subtraction operator for matrix subtraction.
+
+          Args:
+              other: Another Matrix object.
+
+          Returns:
+              A new Matrix object representing the difference of the two matrices.
+
+          Raises:
+              ValueError: If the matrices have different dimensions.
+          """
+          return self.sub(other)
+
+      def __mul__(self, other):
+          """
+          Overloads the multiplication operator
+          for element-wise multiplication or scalar multiplication.
+
+          Args:
+              other: Another Matrix object or a constant (int or float).
+
+          Returns:
+              A new Matrix object representing the product.
+
+          Raises:
+              ValueError: If the other operand is a Matrix with different dimensions.
+              TypeError: If the other operand is not a Matrix, int, or float.
+          """
+          return self.mul(other)
+
+      def __iadd__(self, other):
+          """
+          In-place addition (A += B) into the buffer of the matrix, also in
+          lazy mode.
+          """
+          return self.add(other, out=self)
+
+      def __isub__(self, other):
+          """
+          In-place subtraction (A -= B) into the buffer of the matrix.
+          """
+          return self.sub(other, out=self)
+
+      def __imul__(self, other):
+          """
+          In-place element-wise or scalar multiplication (A *= B, A *= 2).
+          """
+          return self.mul(other, out=self)
 
 
       def __rmul__(self, other):
@@ -167,22 +1080,100 @@ class Matrix:
           Raises:
               ValueError: If the matrices cannot be multiplied (dimensions mismatch).
           """
-          if len(self.data[0]) != len(other.data):
+          return self.matmul(other)
+
+      def __imatmul__(self, other):
+          """
+          In-place matrix multiplication (A @= B, also A @= A). The product is
+          written into the buffer of the matrix if it keeps its shape,
+          otherwise A is bound to a new matrix as without __imatmul__.
+          """
+          if other.shape[1] != self._shape[1]:
+              return self.matmul(other)
+          return self.matmul(other, out=self)
+
+      def matmul(self, other, out=None):
+          """
+          Matrix multiplication, optionally into an existing matrix. The
+          product is computed in full before it is written, so out may be
+          self or other.
+
+          Args:
+              other: Another Matrix object.
+              out: A Matrix of the shape of the product to write it into,
+                  None for a new matrix.
+
+          Returns:
+              out or a new Matrix object.
+
+          Raises:
+              ValueError: If the matrices cannot be multiplied (dimensions mismatch).
+          """
+          if isinstance(other, MatrixExpression):
+              other = other.evaluate()
+          if self._shape[1] != other.shape[0]:
               raise ValueError(
                   "Number of columns in the first matrix must equal the "
                   "number of rows in the second matrix for matrix "
                   "multiplication."
               )
+          shape = (self._shape[0], other.shape[1])
+          if out is not None:
+              out = _check_out(out, shape)
+
+          result = self._delegate("matmul", other, out)
+          if result is not None:
+              return result
+          result = self._matmul_rows(other)
+          values = [x for row in result for x in row]
+          typecode = _result_typecode(self._typecode, other._typecode)
+          if out is None:
+              return Matrix._from_values(values, shape, typecode)
+          out._assign(values, typecode)
+          return out
+
+      def _matmul_rows(self, other):
+          """
+          Multiplies with the engine suiting the shapes: large products are
+          split into blocks over worker processes if workers are set, large
+          integer matrices otherwise use Strassen (exact), everything else
+          dot products of the rows and the columns, tiled when the columns
+          do not fit the cache (the same summation order as the textbook
+          loop, so floats round the same).
+
+          Args:
+              other: Another Matrix object with as many rows as self has columns.
+
+          Returns:
+              The rows of the product as lists.
+          """
+          m, k = self._shape
+          p = other.shape[1]
+          tile_size = max(1, self.tile_bytes // (8 * k))
+          workers = self.workers or os.cpu_count() or 1
+          if workers > 1 and m * k * p >= self.parallel_threshold \
+                  and self._typecode is not None and other._typecode is not None:
+              return parallel_kernel(self.rows(), self._typecode,
+                                     other.columns(), other._typecode,
+                                     (m, k, p), workers, tile_size)
+          if min(m, k, p) >= self.strassen_threshold \
+                  and self.is_integer() and other.is_integer():
+              return strassen(list(self.rows()), list(other.rows()),
+                              self.strassen_threshold)
+          # the columns of a transposed view (A @ B.get_transposed()) are
+          # contiguous rows of its buffer, read without a strided gather
+          columns = list(other.columns())
+          if tile_size >= p:
+              return dot_kernel(self.rows(), columns)
+          return tiled_kernel(list(self.rows()), columns, tile_size)
 
-          result_data = [
-              [0 for _ in range(len(other.data[0]))]
-              for _ in range(len(self.data))
-          ]
-          for i in range(len(self.data)):
-              for j in range(len(other.data[0])):
-                  for k in range(len(other.data)):
-                      result_data[i][j] += self.data[i][k] * other.data[k][j]
-          return Matrix(result_data)
+      def is_integer(self):
+          """
+          Returns True if every element is an integer.
+          """
+          if self._typecode is not None:
+              return self._typecode == "q"
+          return all(isinstance(x, int) for x in self.flat())
 
       def __eq__(self, other):
           """
@@ -194,35 +1185,39 @@ class Matrix:
           Returns:
               True if the matrices are equal, False otherwise.
           """
+          if isinstance(other, MatrixExpression):
+              other = other.evaluate()
           if not isinstance(other, Matrix):
               return False
           if self.shape != other.shape:
               return False
-          for i in range(self.shape[0]):
-              for j in range(self.shape[1]):
-                  if self.data[i][j] != other.data[i][j]:
-                      return False
-          return True
+          left, right = self.flat(), other.flat()
+          if isinstance(left, (array, memoryview)) and isinstance(right, (array, memoryview)):
+              return left == right  # compared in C
+          return all(map(operator.eq, left, right))
 
       def get_transposed(self):
           """
-          Returns the transposed matrix.
+          Returns the transposed matrix as a view: nothing is copied, the
+          strides are swapped (copy() materialises it).
 
           Returns:
-              A new Matrix object representing the transposed matrix.
+              A new Matrix object sharing the buffer, changing it changes
+              the original matrix.
           """
-          transposed_data = [
-              [self.data[j][i] for j in range(len(self.data))]
-              for i in range(len(self.data[0]))
-          ]
-          return Matrix(transposed_data)
+          return Matrix._wrap(self._buffer,
+                              self._typecode,
+                              (self._shape[1], self._shape[0]),
+                              (self._strides[1], self._strides[0]),
+                              self._offset,
+                              owned=False)
 
       @property # Instead of matrix_instance.shape(), able to use matrix_instance.shape
       def shape(self):
           """
           Returns the shape of the matrix as a tuple (rows, columns).
           """
-          return (len(self.data), len(self.data[0]))
+          return self._shape
 
       @classmethod # Methods that create and return instances of the class in different ways.
       def randmat(cls, rows, cols):
@@ -236,11 +1231,8 @@ class Matrix:
           Returns:
               A new Matrix object with random integers.
           """
-          random_data = [
-              [random.randint(0, 9) for _ in range(cols)]
-              for _ in range(rows)
-          ]
-          return cls(random_data)
+          random_data = array("q", [random.randint(0, 9) for _ in range(rows * cols)])
+          return cls._wrap(random_data, "q", (rows, cols))
 
       @classmethod # Operates on the class itself
       def test_property(cls, left_side, right_side):
@@ -258,4 +1250,289 @@ class Matrix:
           print("right side: \n", right_side)
           print()
 
-          print("Matrix equality:", left_side == right_side)
\ No newline at end of file
+          print("Matrix equality:", left_side == right_side)
+
+
+
+class MatrixExpression:
+      """
+      A lazy element-wise expression of matrices and constants (+, - and *).
+
+      Nothing is computed until the result is needed (evaluate(), data,
+      __str__, __eq__, ...). Then the whole tree runs in one pass over the
+      elements with a kernel generated for its structure, so no intermediate
+      matrix is allocated, and a subexpression occurring more than once is
+      computed once per element. The operations are the same as the eager
+      ones, so are the results. Writing into an operand (item assignment,
+      in-place operators, out=) first evaluates the pending expressions
+      reading its buffer, so they still see the values it had when they
+      were built (writes made directly through NumPy are not tracked).
+      """
+      __slots__ = ("op", "left", "right", "_shape", "_typecode", "_result", "_depth",
+                   "__weakref__")
+
+      # generated kernels by their source code
+      kernels = {}
+      # operands this deep are evaluated when used, generated code stays shallow
+      max_depth = 32
+
+      def __init__(self, op, left, right):
+          """
+          Constructor for an expression node (the shapes are already checked).
+
+          Args:
+              op: "+", "-" or "*".
+              left: A Matrix or a MatrixExpression.
+              right: A Matrix, a MatrixExpression or a constant (int or float).
+          """
+          for operand in (left, right):
+              if isinstance(operand, MatrixExpression) and operand._depth >= self.max_depth:
+                  operand.evaluate()
+          if isinstance(left, MatrixExpression) and left._result is not None:
+              left = left._result
+          if isinstance(right, MatrixExpression) and right._result is not None:
+              right = right._result
+          self.op = op
+          self.left = left
+          self.right = right
+          self._depth = 1 + max(operand._depth if isinstance(operand, MatrixExpression)
+                                and operand._result is None else 0
+                                for operand in (left, right))
+          self._shape = left.shape
+          right_typecode = right._typecode if isinstance(right, (Matrix, MatrixExpression)) \
+              else "d" if isinstance(right, float) else "q"
+          self._typecode = _result_typecode(left._typecode, right_typecode)
+          self._result = None
+          if len(_dependents) > 1024:
+              # drop the buffers whose expressions were discarded unevaluated
+              for key in [key for key, dependents in _dependents.items() if not dependents]:
+                  del _dependents[key]
+          for operand in (left, right):
+              # an unevaluated operand by its own id, until it has a result
+              if isinstance(operand, Matrix):
+                  key = id(_base(operand._buffer))
+              elif isinstance(operand, MatrixExpression):
+                  key = id(operand)
+              else:
+                  continue
+              dependents = _dependents.setdefault(key, weakref.WeakValueDictionary())
+              dependents[id(self)] = self
+
+      def _release(self):
+          """
+          Stops tracking the buffers of the operands (after the evaluation
+          the expression does not read them any more).
+          """
+          for operand in (self.left, self.right):
+              keys = []
+              if isinstance(operand, Matrix):
+                  keys.append(id(_base(operand._buffer)))
+              elif isinstance(operand, MatrixExpression):
+                  keys.append(id(operand))
+                  if operand._result is not None:
+                      keys.append(id(_base(operand._result._buffer)))
+              for key in keys:
+                  dependents = _dependents.get(key)
+                  if dependents is not None:
+                      dependents.pop(id(self), None)
+                      if not dependents:
+                          del _dependents[key]
+
+      @property
+      def shape(self):
+          """
+          Returns the shape of the result as a tuple (rows, columns).
+          """
+          return self._shape
+
+      def evaluate(self, out=None):
+          """
+          Computes the expression (once, the result is kept).
+
+          Args:
+              out: A Matrix of the same shape to write the result into (it
+                  may be an operand of the expression), None to keep it.
+
+          Returns:
+              The resulting Matrix object (out if given).
+          """
+          if out is not None:
+              out = _check_out(out, self._shape)
+              if self._result is None \
+                      and id(self) in _dependents.get(id(_base(out._buffer)), ()):
+                  self.evaluate()  # out is an operand, keep the result before it changes
+              if self._result is not None:
+                  if out is not self._result:
+                      out._assign(self._result.flat(), self._result._typecode)
+                  return out
+              out._assign(self._values(), self._typecode)
+              return out
+          if self._result is None:
+              self._result = Matrix._from_values(self._values(), self._shape, self._typecode)
+              self._release()
+              parents = _dependents.pop(id(self), None)
+              if parents:
+                  # the expressions built on this one now read its result
+                  _dependents[id(_base(self._result._buffer))] = parents
+          return self._result
+
+      def _values(self):
+          """
+          Runs the fused kernel of the expression.
+
+          Returns:
+              The elements of the result in row-major order.
+          """
+          leaves, constants = [], []
+          source = self._kernel_source(leaves, constants)
+          kernel = self.kernels.get(source)
+          if kernel is None:
+              namespace = {}
+              exec(source, namespace)
+              kernel = self.kernels[source] = namespace["kernel"]
+          return kernel(*[leaf.flat() for leaf in leaves], *constants)
+
+      def _kernel_source(self, leaves, constants):
+          """
+          Generates the fused kernel of the expression: a list comprehension
+          over the zipped elements of the leaves, subexpressions occurring
+          more than once are bound to a variable (:=) at their first use.
+
+          Args:
+              leaves: Filled with the distinct matrices of the expression.
+              constants: Filled with the constants of the expression.
+
+          Returns:
+              The source code of a function named kernel, taking the flat
+              leaves and then the constants.
+          """
+          counts = {}
+          self._count(counts)
+          leaf_names, shared_names = {}, {}
+
+          def emit(node):
+              if isinstance(node, MatrixExpression) and node._result is not None:
+                  node = node._result  # already evaluated, a leaf
+              if isinstance(node, Matrix):
+                  if id(node) not in leaf_names:
+                      leaf_names[id(node)] = f"e{len(leaves)}"
+                      leaves.append(node)
+                  return leaf_names[id(node)]
+              if not isinstance(node, MatrixExpression):
+                  constants.append(node)
+                  return f"c{len(constants) - 1}"
+              key = node._key()
+              if key in shared_names:
+                  return shared_names[key]
+              code = f"({emit(node.left)} {node.op} {emit(node.right)})"
+              if counts[key] > 1:
+                  shared_names[key] = f"t{len(shared_names)}"
+                  return f"({shared_names[key]} := {code})"
+              return code
+
+          body = emit(self)
+          elements = ", ".join(f"e{i}" for i in range(len(leaves)))
+          arguments = ", ".join([f"x{i}" for i in range(len(leaves))] +
+                                [f"c{i}" for i in range(len(constants))])
+          inputs = ", ".join(f"x{i}" for i in range(len(leaves)))
+          loop = f"{elements} in zip({inputs})" if len(leaves) > 1 \
+              else f"{elements} in {inputs}"
+          return f"def kernel({arguments}):\n    return [{body} for {loop}]\n"
+
+      def _key(self):
+          """
+          Returns a structural key of the expression: equal keys mean the same
+          operations on the same matrices and constants.
+          """
+          def key(node):
+              if isinstance(node, MatrixExpression):
+                  return node._key() if node._result is None else ("m", id(node._result))
+              if isinstance(node, Matrix):
+                  return ("m", id(node))
+              return ("c", type(node), node)
+          return (self.op, key(self.left), key(self.right))
+
+      def _count(self, counts):
+          """
+          Counts the occurrences of the unevaluated subexpressions.
+          """
+          if self._result is not None:
+              return
+          key = self._key()
+          counts[key] = counts.get(key, 0) + 1
+          if counts[key] == 1:
+              for node in (self.left, self.right):
+                  if isinstance(node, MatrixExpression):
+                      node._count(counts)
+
+      @property
+      def data(self):
+          """
+          Returns the rows of the evaluated matrix (see Matrix.data).
+          """
+          return self.evaluate().data
+
+      def __str__(self):
+          return str(self.evaluate())
+
+      def __eq__(self, other):
+          return self.evaluate() == other
+
+      def __getitem__(self, index):
+          return self.evaluate()[index]
+
+      def __setitem__(self, index, value):
+          self.evaluate()[index] = value
+
+      def __getattr__(self, name):
+          """
+          The rest of the Matrix interface (copy(), rows(), add(), ...) acts
+          on the evaluated matrix, so an expression can stand in for it.
+          """
+          if name.startswith("__") or name in MatrixExpression.__slots__:
+              raise AttributeError(name)  # not set yet, or not a Matrix attribute
+          return getattr(self.evaluate(), name)
+
+      def __array__(self, dtype=None, copy=None):
+          return self.evaluate().__array__(dtype, copy)
+
+      def get_transposed(self):
+          return self.evaluate().get_transposed()
+
+      def __add__(self, other):
+          if self._shape != other.shape:
+              raise ValueError(
+                  "Matrices must have the same dimensions for addition."
+              )
+          return MatrixExpression("+", self, other)
+
+      def __sub__(self, other):
+          if self._shape != other.shape:
+              raise ValueError(
+                  "Matrices must have the same dimensions for subtraction."
+              )
+          return MatrixExpression("-", self, other)
+
+      def __mul__(self, other):
+          if isinstance(other, (Matrix, MatrixExpression)):
+              if self._shape != other.shape:
+                  raise ValueError(
+                      "Matrices must have the same dimensions for "
+                      "element-wise multiplication."
+                  )
+          elif not isinstance(other, (int, float)):
+              raise TypeError(
+                  "Operand must be a Matrix or a constant (int or float)."
+              )
+          return MatrixExpression("*", self, other)
+
+      def __rmul__(self, other):
+          if isinstance(other, (int, float)):
+              return self.__mul__(other)
+          return NotImplemented
+
+      def __matmul__(self, other):
+          return self.evaluate() @ other
+
+      def __rmatmul__(self, other):
+          return other @ self.evaluate()